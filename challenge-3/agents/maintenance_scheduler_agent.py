@@ -9,16 +9,22 @@ Example:
 """
 
 import asyncio
+import hashlib
+import io
 import json
 import logging
 import os
 import sys
-from datetime import datetime, timedelta
-from typing import List
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Final, List, Optional, Tuple
 
+import aiohttp
 from agent_framework.azure import AzureAIClient
 from azure.ai.projects.aio import AIProjectClient
-from azure.identity.aio import AzureCliCredential, DefaultAzureCredential
+from azure.core.credentials_async import AsyncTokenCredential
+from azure.identity.aio import DefaultAzureCredential
 from dotenv import load_dotenv
 from services.cosmos_db_service import (
     CosmosDbService,
@@ -27,11 +33,79 @@ from services.cosmos_db_service import (
     MaintenanceWindow,
     WorkOrder,
 )
+from services.http_session import create_http_session, shared_transport
 from services.observability import enable_tracing
 
 logger = logging.getLogger(__name__)
 load_dotenv(override=True)
 
+_JSON_DECODER = json.JSONDecoder()
+
+# Set once the agent is known to exist in the portal for this process
+_REGISTERED = False
+
+# Identical analysis requests within this window reuse the previous prediction
+_PREDICTION_CACHE_TTL_SECONDS = 600
+_PREDICTION_CACHE_MAX_SIZE = 256
+# Parsed model output keyed by a hash of the deployment and analysis context.
+# Kept for the process, since callers such as the A2A executor build a new agent
+# per request.
+_PREDICTION_CACHE: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+
+# System instructions for the scheduling agent used at runtime
+_SCHEDULING_INSTRUCTIONS: Final[str] = """You are a predictive maintenance expert specializing in industrial tire manufacturing equipment.
+
+Analyze historical maintenance data and recommend optimal maintenance schedules based on:
+1. Historical failure patterns
+2. Risk scores (time since last maintenance, fault frequency, downtime costs, criticality)
+3. Optimal maintenance windows considering production impact
+4. Detailed reasoning
+
+Always respond in valid JSON format as requested."""
+
+# Instructions for the MaintenanceSchedulerAgent version registered in the portal
+_AGENT_INSTRUCTIONS: Final[str] = """You are a Predictive Maintenance Scheduler for industrial tire manufacturing equipment.
+
+Analyze work orders, historical maintenance data, and available maintenance windows to:
+1. Assess equipment failure risk based on historical patterns and work order priority
+2. Identify optimal maintenance windows that minimize production disruption
+3. Generate predictive maintenance schedules with risk scores and recommendations
+
+Consider factors like:
+- Work order priority (high/medium/low)
+- Historical maintenance frequency and patterns
+- Production impact of maintenance windows
+- Equipment estimated repair duration
+
+Output JSON with: scheduled_date, risk_score (0-100), predicted_failure_probability (0-1), recommended_action (IMMEDIATE/URGENT/SCHEDULED/MONITOR), and reasoning."""
+
+# Static tail of the analysis prompt, including the expected JSON schema
+_ANALYSIS_REQUEST = """
+## Analysis Required
+Please provide a JSON response with:
+1. Risk score (0-100): Priority base + MTBF progress + historical impact
+2. Failure probability (0.0-1.0)
+3. Optimal maintenance window selection
+4. Recommended action: IMMEDIATE, URGENT, or SCHEDULED
+5. Detailed reasoning
+
+```json
+{
+  "scheduledDate": "<ISO datetime>",
+  "maintenanceWindow": {
+    "id": "<window ID>",
+    "startTime": "<ISO datetime>",
+    "endTime": "<ISO datetime>",
+    "productionImpact": "<Low|Medium|High>",
+    "isAvailable": true
+  },
+  "riskScore": <0-100>,
+  "predictedFailureProbability": <0.0-1.0>,
+  "recommendedAction": "<IMMEDIATE|URGENT|SCHEDULED>",
+  "reasoning": "<detailed explanation>"
+}
+```"""
+
 
 # =============================================================================
 # Agent Service
@@ -41,10 +115,37 @@ load_dotenv(override=True)
 class MaintenanceSchedulerAgent:
     """AI Agent for predictive maintenance scheduling"""
 
-    def __init__(self, project_endpoint: str, deployment_name: str, cosmos_service: CosmosDbService):
+    def __init__(
+        self,
+        project_endpoint: str,
+        deployment_name: str,
+        cosmos_service: CosmosDbService,
+        credential: AsyncTokenCredential,
+    ):
         self.project_endpoint = project_endpoint
         self.deployment_name = deployment_name
         self.cosmos_service = cosmos_service
+        # Reused across runs so the credential chain and token cache are only set up once
+        self.credential = credential
+
+    def _get_cached_prediction(self, key: str) -> Optional[dict]:
+        """Return a cached prediction if it has not expired."""
+        entry = _PREDICTION_CACHE.get(key)
+        if entry is None:
+            return None
+        stored_at, data = entry
+        if time.monotonic() - stored_at > _PREDICTION_CACHE_TTL_SECONDS:
+            del _PREDICTION_CACHE[key]
+            return None
+        _PREDICTION_CACHE.move_to_end(key)
+        return data
+
+    def _cache_prediction(self, key: str, data: dict):
+        """Store a prediction, evicting the least recently used entry when full."""
+        _PREDICTION_CACHE[key] = (time.monotonic(), data)
+        _PREDICTION_CACHE.move_to_end(key)
+        if len(_PREDICTION_CACHE) > _PREDICTION_CACHE_MAX_SIZE:
+            _PREDICTION_CACHE.popitem(last=False)
 
     def _safe_parse_datetime(self, value, fallback: datetime) -> datetime:
         """Parse ISO datetime safely and fall back when model output is invalid."""
@@ -53,7 +154,7 @@ class MaintenanceSchedulerAgent:
         try:
             return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
         except Exception:
-            print(
+            logger.warning(
                 f"   Warning: Invalid datetime '{value}' from model response. Using fallback.")
             return fallback
 
@@ -66,22 +167,20 @@ class MaintenanceSchedulerAgent:
         """Predict optimal maintenance schedule using AI"""
 
         context = self._build_context(work_order, history, windows)
+        cache_key = hashlib.blake2b(
+            f"{self.deployment_name}\n{context}".encode(), digest_size=16).hexdigest()
+        data = self._get_cached_prediction(cache_key)
+        if data is not None:
+            logger.info("   ✅ Reusing cached prediction for identical analysis context")
+            return self._build_schedule(work_order, windows, data)
+
         chat_history_json = await self.cosmos_service.get_machine_chat_history(work_order.machine_id)
-        print(
+        logger.info(
             f"   Using persistent chat history for machine: {work_order.machine_id}")
 
-        instructions = """You are a predictive maintenance expert specializing in industrial tire manufacturing equipment.
-
-Analyze historical maintenance data and recommend optimal maintenance schedules based on:
-1. Historical failure patterns
-2. Risk scores (time since last maintenance, fault frequency, downtime costs, criticality)
-3. Optimal maintenance windows considering production impact
-4. Detailed reasoning
-
-Always respond in valid JSON format as requested."""
-
         # Build full prompt including any chat history context
         full_prompt = context
+        history_msgs: List[dict] = []
         if chat_history_json:
             try:
                 history_msgs = json.loads(chat_history_json)
@@ -90,24 +189,32 @@ Always respond in valid JSON format as requested."""
                 )
                 full_prompt = f"Previous conversation context:\n{history_context}\n\n{context}"
             except Exception as e:
-                print(f"   Warning: Could not restore chat history: {e}")
+                logger.warning(f"   Warning: Could not restore chat history: {e}")
 
         # Use newer AzureAIClient pattern (matches anomaly_classification_agent.py)
-        async with AzureCliCredential() as credential:
-            async with AzureAIClient(credential=credential).create_agent(
-                name="MaintenanceSchedulerAgent",
-                description="Predictive maintenance scheduling agent for tire manufacturing",
-                instructions=instructions,
-            ) as agent:
-                print(f"   ✅ Using agent: {agent.id}")
-                result = await agent.run(full_prompt)
-                response_text = result.text
-
-                # Save interaction to chat history
-                await self._save_interaction_history(work_order.machine_id, context, response_text)
-
-        json_response = self._extract_json(response_text)
-        data = json.loads(json_response)
+        async with AzureAIClient(credential=self.credential).create_agent(
+            name="MaintenanceSchedulerAgent",
+            description="Predictive maintenance scheduling agent for tire manufacturing",
+            instructions=_SCHEDULING_INSTRUCTIONS,
+        ) as agent:
+            logger.info(f"   ✅ Using agent: {agent.id}")
+            result = await agent.run(full_prompt)
+            response_text = result.text
+
+            # Save interaction to chat history
+            await self._save_interaction_history(work_order.machine_id, history_msgs, context, response_text)
+
+        data = self._extract_json(response_text)
+        self._cache_prediction(cache_key, data)
+        return self._build_schedule(work_order, windows, data)
+
+    def _build_schedule(
+        self,
+        work_order: WorkOrder,
+        windows: List[MaintenanceWindow],
+        data: dict,
+    ) -> MaintenanceSchedule:
+        """Map the model's JSON prediction onto a MaintenanceSchedule"""
 
         fallback_window = windows[0] if windows else MaintenanceWindow(
             id="fallback-window",
@@ -155,153 +262,128 @@ Always respond in valid JSON format as requested."""
             created_at=datetime.utcnow(),
         )
 
-    async def _save_interaction_history(self, machine_id: str, user_prompt: str, assistant_response: str):
-        """Save interaction to Cosmos DB chat history"""
+    async def _save_interaction_history(
+        self,
+        machine_id: str,
+        previous_messages: List[dict],
+        user_prompt: str,
+        assistant_response: str,
+    ):
+        """Save interaction to Cosmos DB chat history
 
-        try:
-            # Get existing history
-            existing_json = await self.cosmos_service.get_machine_chat_history(machine_id)
-            messages = json.loads(existing_json) if existing_json else []
+        previous_messages is the history already loaded for this prediction, so
+        the stored document does not have to be read a second time.
+        """
 
-            # Append new interaction
+        try:
+            # Keep only last 10 messages, including the new interaction
+            messages = previous_messages[-8:]
             messages.append({"role": "user", "content": user_prompt})
             messages.append(
                 {"role": "assistant", "content": assistant_response})
 
-            # Keep only last 10 messages
-            messages = messages[-10:]
-
             await self.cosmos_service.save_machine_chat_history(machine_id, json.dumps(messages))
         except Exception as e:
-            print(f"   Warning: Could not save chat history: {e}")
+            logger.warning(f"   Warning: Could not save chat history: {e}")
 
     def _build_context(self, work_order: WorkOrder, history: List[MaintenanceHistory], windows: List[MaintenanceWindow]) -> str:
         """Build analysis context for AI"""
 
-        lines = [
-            "# Predictive Maintenance Analysis Request",
-            "",
-            "## Work Order Information",
-            f"- Work Order ID: {work_order.id}",
-            f"- Machine ID: {work_order.machine_id}",
-            f"- Fault Type: {work_order.fault_type}",
-            f"- Priority: {work_order.priority}",
-            f"- Estimated Duration: {work_order.estimated_duration} minutes",
-            "",
-            "## Historical Maintenance Data",
-        ]
+        buf = io.StringIO()
+        w = buf.write
+
+        w("# Predictive Maintenance Analysis Request\n\n## Work Order Information\n")
+        w(f"- Work Order ID: {work_order.id}\n")
+        w(f"- Machine ID: {work_order.machine_id}\n")
+        w(f"- Fault Type: {work_order.fault_type}\n")
+        w(f"- Priority: {work_order.priority}\n")
+        w(f"- Estimated Duration: {work_order.estimated_duration} minutes\n")
+        w("\n## Historical Maintenance Data\n")
 
         if history:
-            lines.append(f"Total maintenance events: {len(history)}")
-            lines.append("")
-
-            relevant_history = [
-                h for h in history if h.fault_type == work_order.fault_type]
-            if relevant_history:
-                lines.append(
-                    f"**Similar fault type ({work_order.fault_type}):**")
-                lines.append(f"- Occurrences: {len(relevant_history)}")
-                avg_downtime = sum(
-                    h.downtime for h in relevant_history) / len(relevant_history)
-                avg_cost = sum(h.cost for h in relevant_history) / \
-                    len(relevant_history)
-                lines.append(f"- Average downtime: {avg_downtime:.0f} minutes")
-                lines.append(f"- Average cost: ${avg_cost:.2f}")
-
-                if len(relevant_history) >= 2:
-                    dates = sorted(
-                        [h.occurrence_date for h in relevant_history if h.occurrence_date])
-                    if len(dates) >= 2:
-                        intervals = [
-                            (dates[i] - dates[i - 1]).days for i in range(1, len(dates))]
-                        avg_interval = sum(intervals) / len(intervals)
-                        lines.append(
-                            f"- Mean Time Between Failures (MTBF): {avg_interval:.0f} days")
-
-                        last_occurrence = max(
-                            h.occurrence_date for h in relevant_history if h.occurrence_date)
-                        days_since_last = (
-                            datetime.utcnow() - last_occurrence).days
-                        lines.append(
-                            f"- Days since last occurrence: {days_since_last:.0f}")
-                        lines.append(
-                            f"- Failure cycle progress: {(days_since_last / avg_interval * 100):.1f}%")
+            w(f"Total maintenance events: {len(history)}\n\n")
+
+            # Aggregate the matching fault type in a single pass over history
+            occurrences = 0
+            total_downtime = 0
+            total_cost = 0.0
+            dates: List[datetime] = []
+            fault_type = work_order.fault_type
+            for h in history:
+                if h.fault_type != fault_type:
+                    continue
+                occurrences += 1
+                total_downtime += h.downtime
+                total_cost += h.cost
+                if h.occurrence_date:
+                    dates.append(h.occurrence_date)
+
+            if occurrences:
+                w(f"**Similar fault type ({work_order.fault_type}):**\n")
+                w(f"- Occurrences: {occurrences}\n")
+                avg_downtime = total_downtime / occurrences
+                avg_cost = total_cost / occurrences
+                w(f"- Average downtime: {avg_downtime:.0f} minutes\n")
+                w(f"- Average cost: ${avg_cost:.2f}\n")
+
+                if len(dates) >= 2:
+                    dates.sort()
+                    # Whole days per interval, as before, so MTBF is not rounded differently
+                    avg_interval = sum(
+                        (b - a).days for a, b in zip(dates, dates[1:])) / (len(dates) - 1)
+                    w(f"- Mean Time Between Failures (MTBF): {avg_interval:.0f} days\n")
+
+                    last_occurrence = dates[-1]
+                    now = datetime.now(timezone.utc) if last_occurrence.tzinfo else datetime.utcnow()
+                    days_since_last = (now - last_occurrence).days
+                    w(f"- Days since last occurrence: {days_since_last:.0f}\n")
+                    w(f"- Failure cycle progress: {(days_since_last / avg_interval * 100):.1f}%\n")
             else:
-                lines.append(
-                    f"**No previous occurrences of {work_order.fault_type} fault type.**")
+                w(f"**No previous occurrences of {work_order.fault_type} fault type.**\n")
 
-            lines.append("")
-            lines.append("**Recent maintenance events (all types):**")
+            w("\n**Recent maintenance events (all types):**\n")
             for record in history[:5]:
-                if record.occurrence_date:
-                    lines.append(
-                        f"- {record.occurrence_date.strftime('%Y-%m-%d')}: {record.fault_type} ({record.downtime}min, ${record.cost})"
-                    )
+                d = record.occurrence_date
+                if d:
+                    w(f"- {d.year:04d}-{d.month:02d}-{d.day:02d}: {record.fault_type} ({record.downtime}min, ${record.cost})\n")
         else:
-            lines.append("⚠️  No historical maintenance data available.")
-            lines.append(
-                "Risk assessment will be based on fault type and priority only.")
+            w("⚠️  No historical maintenance data available.\n")
+            w("Risk assessment will be based on fault type and priority only.\n")
 
-        lines.extend(["", "## Available Maintenance Windows (Next 14 Days)"])
+        w("\n## Available Maintenance Windows (Next 14 Days)\n")
 
         if windows:
             for window in windows[:10]:
-                if window.start_time and window.end_time:
-                    duration = (window.end_time -
-                                window.start_time).total_seconds() / 3600
-                    lines.append(
-                        f"- **{window.start_time.strftime('%Y-%m-%d %H:%M')} to {window.end_time.strftime('%H:%M')}** ({duration:.1f}h)"
+                start, end = window.start_time, window.end_time
+                if start and end:
+                    duration = (end - start).total_seconds() / 3600
+                    w(
+                        f"- **{start.year:04d}-{start.month:02d}-{start.day:02d} {start.hour:02d}:{start.minute:02d}"
+                        f" to {end.hour:02d}:{end.minute:02d}** ({duration:.1f}h)\n"
                     )
-                    lines.append(
-                        f"  * Production Impact: {window.production_impact}")
-                    lines.append(f"  * Window ID: {window.id}")
+                    w(f"  * Production Impact: {window.production_impact}\n")
+                    w(f"  * Window ID: {window.id}\n")
         else:
-            lines.append("⚠️  No maintenance windows available!")
-
-        lines.extend(
-            [
-                "",
-                "## Analysis Required",
-                "Please provide a JSON response with:",
-                "1. Risk score (0-100): Priority base + MTBF progress + historical impact",
-                "2. Failure probability (0.0-1.0)",
-                "3. Optimal maintenance window selection",
-                "4. Recommended action: IMMEDIATE, URGENT, or SCHEDULED",
-                "5. Detailed reasoning",
-                "",
-                "```json",
-                "{",
-                '  "scheduledDate": "<ISO datetime>",',
-                '  "maintenanceWindow": {',
-                '    "id": "<window ID>",',
-                '    "startTime": "<ISO datetime>",',
-                '    "endTime": "<ISO datetime>",',
-                '    "productionImpact": "<Low|Medium|High>",',
-                '    "isAvailable": true',
-                "  },",
-                '  "riskScore": <0-100>,',
-                '  "predictedFailureProbability": <0.0-1.0>,',
-                '  "recommendedAction": "<IMMEDIATE|URGENT|SCHEDULED>",',
-                '  "reasoning": "<detailed explanation>"',
-                "}",
-                "```",
-            ]
-        )
+            w("⚠️  No maintenance windows available!\n")
 
-        return "\n".join(lines)
+        w(_ANALYSIS_REQUEST)
+        return buf.getvalue()
 
-    def _extract_json(self, response: str) -> str:
-        """Extract JSON from response"""
+    def _extract_json(self, response: str) -> dict:
+        """Extract and parse the JSON object from response
 
-        if "```json" in response:
-            start = response.index("```json") + 7
-            end = response.index("```", start)
-            return response[start:end].strip()
+        The object is decoded in place starting at its opening brace, so the
+        surrounding prose and code fence never need to be sliced off first.
+        """
 
-        start = response.find("{")
+        fence = response.find("```json")
+        start = response.find("{", fence + 7 if fence >= 0 else 0)
         if start >= 0:
-            end = response.rfind("}")
-            return response[start: end + 1]
+            try:
+                data, _ = _JSON_DECODER.raw_decode(response, start)
+                return data
+            except json.JSONDecodeError:
+                pass
 
         raise Exception("Could not extract JSON from agent response")
 
@@ -314,7 +396,9 @@ Always respond in valid JSON format as requested."""
 async def main():
     """Main program"""
 
-    print("=== Predictive Maintenance Agent ===\n")
+    logging.basicConfig(level=logging.INFO, format="%(message)s",
+                        handlers=[logging.StreamHandler(sys.stdout)])
+    logger.info("=== Predictive Maintenance Agent ===\n")
 
     # Load configuration (use AZURE_AI_PROJECT_ENDPOINT for consistency with other challenge scripts)
     cosmos_endpoint = os.getenv("COSMOS_ENDPOINT")
@@ -328,54 +412,68 @@ async def main():
 
     # Validate
     if not all([cosmos_endpoint, cosmos_key, database_name, foundry_project_endpoint]):
-        print("Error: Missing required environment variables.")
-        print("Required: COSMOS_ENDPOINT, COSMOS_KEY, COSMOS_DATABASE_NAME, AZURE_AI_PROJECT_ENDPOINT")
+        logger.error("Error: Missing required environment variables.")
+        logger.error("Required: COSMOS_ENDPOINT, COSMOS_KEY, COSMOS_DATABASE_NAME, AZURE_AI_PROJECT_ENDPOINT")
         return
 
-    enable_tracing(app_insights_connection)
-
-    cosmos_service = CosmosDbService(
-        cosmos_endpoint, cosmos_key, database_name)
+    enable_tracing(app_insights_connection, traces_only=os.getenv("TRACES_ONLY") == "1")
 
-    # Register agent in Azure AI Foundry portal
+    # One credential for the whole run, shared by the portal client and the agent,
+    # and one connection pool shared by the Cosmos and portal clients
     async with (
+        create_http_session() as http_session,
+        CosmosDbService(
+            cosmos_endpoint,
+            cosmos_key,
+            database_name,
+            transport=shared_transport(http_session),
+        ) as cosmos_service,
         DefaultAzureCredential() as credential,
-        AIProjectClient(endpoint=foundry_project_endpoint, credential=credential) as project_client,
     ):
+        await run(
+            cosmos_service,
+            credential,
+            foundry_project_endpoint,
+            deployment_name,
+            http_session,
+        )
+
+
+async def register_agent(
+    credential: AsyncTokenCredential,
+    foundry_project_endpoint: str,
+    deployment_name: str,
+    http_session: Optional[aiohttp.ClientSession] = None,
+):
+    """Register MaintenanceSchedulerAgent in Azure AI Foundry if it is not there yet"""
+
+    global _REGISTERED
+    if _REGISTERED:
+        return
+
+    transport = shared_transport(http_session) if http_session is not None else None
+    async with AIProjectClient(
+        endpoint=foundry_project_endpoint, credential=credential, transport=transport
+    ) as project_client:
         try:
             from azure.ai.projects.models import PromptAgentDefinition
+            from azure.core.exceptions import ResourceNotFoundError
 
-            print("   Checking existing agent versions in portal...")
-            version_count = 0
+            logger.info("   Checking for MaintenanceSchedulerAgent in portal...")
             try:
-                async for _ in project_client.agents.list_versions(agent_name="MaintenanceSchedulerAgent"):
-                    version_count += 1
-                print(f"   Found {version_count} existing versions")
-            except Exception as e:
-                print(f"   Error checking versions: {e}")
-
-            print(
-                f"   Creating new version (will be version #{version_count + 1})...")
+                await project_client.agents.get(agent_name="MaintenanceSchedulerAgent")
+                logger.info("   ✅ Agent already registered\n")
+                _REGISTERED = True
+                return
+            except ResourceNotFoundError:
+                pass
 
             definition = PromptAgentDefinition(
                 model=deployment_name,
-                instructions="""You are a Predictive Maintenance Scheduler for industrial tire manufacturing equipment.
-
-Analyze work orders, historical maintenance data, and available maintenance windows to:
-1. Assess equipment failure risk based on historical patterns and work order priority
-2. Identify optimal maintenance windows that minimize production disruption
-3. Generate predictive maintenance schedules with risk scores and recommendations
-
-Consider factors like:
-- Work order priority (high/medium/low)
-- Historical maintenance frequency and patterns
-- Production impact of maintenance windows
-- Equipment estimated repair duration
-
-Output JSON with: scheduled_date, risk_score (0-100), predicted_failure_probability (0-1), recommended_action (IMMEDIATE/URGENT/SCHEDULED/MONITOR), and reasoning.""",
+                instructions=_AGENT_INSTRUCTIONS,
             )
 
-            print(
+            logger.info(
                 "   Registering MaintenanceSchedulerAgent in Azure AI Foundry portal...")
             registered_agent = await project_client.agents.create_version(
                 agent_name="MaintenanceSchedulerAgent",
@@ -384,85 +482,92 @@ Output JSON with: scheduled_date, risk_score (0-100), predicted_failure_probabil
                 metadata={
                     "framework": "agent-framework",
                     "purpose": "maintenance_scheduling",
-                    "timestamp": datetime.utcnow().isoformat(),
+                    "timestamp": datetime.now(timezone.utc).isoformat(),
                 },
             )
-            print("   ✅ New version created!")
-            print(
+            _REGISTERED = True
+            logger.info("   ✅ New version created!")
+            logger.info(
                 f"      Agent ID: {registered_agent.id if hasattr(registered_agent, 'id') else 'N/A'}")
-
-            print("   Verifying creation...")
-            verify_count = 0
-            async for _ in project_client.agents.list_versions(agent_name="MaintenanceSchedulerAgent"):
-                verify_count += 1
-            print(f"   Total versions now in portal: {verify_count}")
-            print("   Check portal at: https://ai.azure.com\n")
+            logger.info("   Check portal at: https://ai.azure.com\n")
         except Exception as e:
-            print(f"   ⚠️  Could not register agent in portal: {e}\n")
-            logger.warning(f"Could not register agent in portal: {e}")
+            logger.warning(f"   ⚠️  Could not register agent in portal: {e}\n")
+
+
+async def run(
+    cosmos_service: CosmosDbService,
+    credential: AsyncTokenCredential,
+    foundry_project_endpoint: str,
+    deployment_name: str,
+    http_session: Optional[aiohttp.ClientSession] = None,
+):
+    """Schedule maintenance for the requested work order"""
+
+    await cosmos_service.ensure_containers("MaintenanceSchedules", "ChatHistories")
+
+    # Registering the agent in the portal is control-plane work, so it is opt-in
+    if os.getenv("REGISTER_AGENT") == "1":
+        await register_agent(credential, foundry_project_endpoint, deployment_name, http_session)
 
     agent_service = MaintenanceSchedulerAgent(
-        foundry_project_endpoint, deployment_name, cosmos_service)
+        foundry_project_endpoint, deployment_name, cosmos_service, credential)
 
     # Get work order
-    print("1. Retrieving work order...")
+    logger.info("1. Retrieving work order...")
     work_order_id = sys.argv[1] if len(sys.argv) > 1 else "wo-2024-468"
 
     try:
         work_order = await cosmos_service.get_work_order(work_order_id)
-        print(f"   ✓ Work Order: {work_order.id}")
-        print(f"   Machine: {work_order.machine_id}")
-        print(f"   Fault: {work_order.fault_type}")
-        print(f"   Priority: {work_order.priority}\n")
+        logger.info(f"   ✓ Work Order: {work_order.id}")
+        logger.info(f"   Machine: {work_order.machine_id}")
+        logger.info(f"   Fault: {work_order.fault_type}")
+        logger.info(f"   Priority: {work_order.priority}\n")
     except Exception as e:
-        print(f"   ✗ Error: {str(e)}")
+        logger.error(f"   ✗ Error: {str(e)}")
         return
 
-    print("2. Analyzing historical maintenance data...")
+    logger.info("2. Analyzing historical maintenance data...")
     history = await cosmos_service.get_maintenance_history(work_order.machine_id)
-    print(f"   ✓ Found {len(history)} historical maintenance records\n")
+    logger.info(f"   ✓ Found {len(history)} historical maintenance records\n")
 
-    print("3. Checking available maintenance windows...")
+    logger.info("3. Checking available maintenance windows...")
     windows = await cosmos_service.get_available_maintenance_windows(14)
-    print(f"   ✓ Found {len(windows)} available windows in next 14 days\n")
+    logger.info(f"   ✓ Found {len(windows)} available windows in next 14 days\n")
 
-    print("4. Running AI predictive analysis...")
+    logger.info("4. Running AI predictive analysis...")
     try:
         schedule = await agent_service.predict_schedule(work_order, history, windows)
-        print("   ✓ Analysis complete!\n")
+        logger.info("   ✓ Analysis complete!\n")
 
-        print("=== Predictive Maintenance Schedule ===")
-        print(f"Schedule ID: {schedule.id}")
-        print(f"Machine: {schedule.machine_id}")
-        print(
+        logger.info("=== Predictive Maintenance Schedule ===")
+        logger.info(f"Schedule ID: {schedule.id}")
+        logger.info(f"Machine: {schedule.machine_id}")
+        logger.info(
             f"Scheduled Date: {schedule.scheduled_date.strftime('%Y-%m-%d %H:%M')}")
-        print(
+        logger.info(
             f"Window: {schedule.maintenance_window.start_time.strftime('%H:%M')} - {schedule.maintenance_window.end_time.strftime('%H:%M')}"
         )
-        print(
+        logger.info(
             f"Production Impact: {schedule.maintenance_window.production_impact}")
-        print(f"Risk Score: {schedule.risk_score}/100")
-        print(
+        logger.info(f"Risk Score: {schedule.risk_score}/100")
+        logger.info(
             f"Failure Probability: {schedule.predicted_failure_probability * 100:.1f}%")
-        print(f"Recommended Action: {schedule.recommended_action}")
-        print("\nReasoning:")
-        print(f"{schedule.reasoning}")
-        print()
+        logger.info(f"Recommended Action: {schedule.recommended_action}")
+        logger.info("\nReasoning:")
+        logger.info(f"{schedule.reasoning}")
+        logger.info("")
 
-        print("5. Saving maintenance schedule...")
+        logger.info("5. Saving maintenance schedule...")
         await cosmos_service.save_maintenance_schedule(schedule)
-        print("   ✓ Schedule saved to Cosmos DB\n")
+        logger.info("   ✓ Schedule saved to Cosmos DB\n")
 
-        print("6. Updating work order status...")
+        logger.info("6. Updating work order status...")
         await cosmos_service.update_work_order_status(work_order.id, "Scheduled")
-        print("   ✓ Work order status updated to 'Scheduled'\n")
+        logger.info("   ✓ Work order status updated to 'Scheduled'\n")
 
-        print("✓ Predictive Maintenance Agent completed successfully!")
+        logger.info("✓ Predictive Maintenance Agent completed successfully!")
     except Exception as e:
-        print(f"   ✗ Error during predictive analysis: {str(e)}")
-        import traceback
-
-        print(f"\nStack trace:\n{traceback.format_exc()}")
+        logger.exception(f"   ✗ Error during predictive analysis: {str(e)}")
 
 
 if __name__ == "__main__":
@@ -2,21 +2,28 @@
 """Parts Ordering Agent - Automated parts ordering using Microsoft Agent Framework.
 
 Usage:
-    python agents/parts_ordering_agent.py [WORK_ORDER_ID]
+    python agents/parts_ordering_agent.py [WORK_ORDER_ID ...] [--register-agent] [--no-trace]
 
 Example:
     python agents/parts_ordering_agent.py wo-2024-468
+
+Several work orders can be passed at once; PARTS_CONCURRENCY (default 8)
+limits how many are processed at the same time.
 """
 
+import argparse
 import asyncio
 import json
 import logging
 import os
+import re
 import sys
 import uuid
-from datetime import datetime
-from typing import List
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Final, List, Optional, Set, Tuple, Union
 
+import aiohttp
 from agent_framework.azure import AzureAIClient
 from azure.ai.projects.aio import AIProjectClient
 from azure.identity.aio import DefaultAzureCredential
@@ -26,15 +33,210 @@ from services.cosmos_db_service import (
     InventoryItem,
     OrderItem,
     PartsOrder,
+    RequiredPart,
     Supplier,
     WorkOrder,
+    WorkOrderChatHistory,
 )
+from services.http_session import create_http_session, shared_transport
 from services.observability import enable_tracing
 
+try:
+    import orjson
+
+    def _json_dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+
+    _json_loads = orjson.loads
+except ImportError:  # orjson is optional; fall back to the standard library
+    _json_dumps = json.dumps
+    _json_loads = json.loads
+
 logger = logging.getLogger(__name__)
 load_dotenv(override=True)
 
 
+@dataclass(frozen=True, slots=True)
+class Config:
+    """Agent settings, read from the environment once at import"""
+
+    cosmos_endpoint: Optional[str]
+    cosmos_key: Optional[str]
+    database_name: Optional[str]
+    foundry_project_endpoint: Optional[str]
+    deployment_name: str
+    app_insights_connection: Optional[str]
+    traces_only: bool
+    register_agent: bool
+    parts_concurrency: int
+    # Names of required settings that are not set
+    missing: Tuple[str, ...] = field(init=False)
+    # Names of settings whose values were unusable and replaced
+    invalid: Tuple[str, ...] = field(init=False)
+
+    def __post_init__(self):
+        required = {
+            "COSMOS_ENDPOINT": self.cosmos_endpoint,
+            "COSMOS_KEY": self.cosmos_key,
+            "COSMOS_DATABASE_NAME": self.database_name,
+            "AZURE_AI_PROJECT_ENDPOINT": self.foundry_project_endpoint,
+        }
+        object.__setattr__(
+            self, "missing", tuple(name for name, value in required.items() if not value))
+
+        invalid = []
+        if self.parts_concurrency < 1:
+            # A semaphore of zero would never let a work order run
+            invalid.append("PARTS_CONCURRENCY")
+            object.__setattr__(self, "parts_concurrency", 1)
+        object.__setattr__(self, "invalid", tuple(invalid))
+
+    @classmethod
+    def from_env(cls) -> "Config":
+        concurrency = os.getenv("PARTS_CONCURRENCY", "8").strip()
+        return cls(
+            cosmos_endpoint=os.getenv("COSMOS_ENDPOINT"),
+            cosmos_key=os.getenv("COSMOS_KEY"),
+            database_name=os.getenv("COSMOS_DATABASE_NAME"),
+            foundry_project_endpoint=os.getenv(
+                "AZURE_AI_PROJECT_ENDPOINT") or os.getenv("AI_FOUNDRY_PROJECT_ENDPOINT"),
+            deployment_name=os.getenv("MODEL_DEPLOYMENT_NAME", "gpt-4o"),
+            app_insights_connection=os.getenv(
+                "APPLICATIONINSIGHTS_CONNECTION_STRING"),
+            traces_only=os.getenv("TRACES_ONLY") == "1",
+            register_agent=os.getenv("REGISTER_AGENT") == "1",
+            # Anything that is not an integer is reported by __post_init__
+            parts_concurrency=int(concurrency) if concurrency.lstrip("-").isdigit() else 0,
+        )
+
+
+CONFIG = Config.from_env()
+
+_PARSER = argparse.ArgumentParser(description="Order missing parts for work orders.")
+_PARSER.add_argument("work_order_ids", nargs="*", default=["2024-468"], metavar="WORK_ORDER_ID")
+_PARSER.add_argument("--register-agent", action="store_true",
+                     help="register a new agent version in the portal (same as REGISTER_AGENT=1)")
+_PARSER.add_argument("--no-trace", action="store_true",
+                     help="do not export traces to Application Insights")
+_PARSER.add_argument("--traces-only", action="store_true",
+                     help="export traces but not metrics or logs (same as TRACES_ONLY=1)")
+
+# A fenced ```json block; without one, everything from the first "{" to the last "}"
+_JSON_FENCE_RE = re.compile(r"```json\s*(.*?)```", re.DOTALL)
+_JSON_OBJECT_RE = re.compile(r"\{.*\}", re.DOTALL)
+
+# Most messages replayed from a legacy (thread-less) chat history record
+_MAX_REPLAY_MESSAGES = 10
+
+# Process-wide Foundry project client and its credential, see get_project_client()
+_CREDENTIAL: Optional[DefaultAzureCredential] = None
+_PROJECT_CLIENT: Optional[AIProjectClient] = None
+
+_ORDERING_INSTRUCTIONS: Final[str] = """You are a parts ordering specialist for industrial tire manufacturing equipment.
+
+Analyze inventory status and optimize parts ordering from suppliers considering:
+1. Current inventory levels vs reorder points
+2. Supplier reliability, lead time, and cost
+3. Previous order history
+4. Order urgency based on work order priority
+
+Always respond in valid JSON format as requested."""
+
+# Instructions for the PartsOrderingAgent version registered in the portal
+_AGENT_INSTRUCTIONS: Final[str] = """You are a Parts Ordering Specialist for industrial tire manufacturing equipment.
+
+Analyze inventory levels and optimize parts ordering from suppliers considering:
+1. Current inventory levels vs reorder points
+2. Supplier reliability, lead time, and cost
+3. Previous order history
+4. Order urgency based on work order priority
+
+When generating orders:
+- Prioritize suppliers with high reliability
+- Balance lead time against urgency
+- Consider total cost optimization
+- Reference inventory data to determine quantities
+
+Always respond in valid JSON format with: supplierId, supplierName, orderItems (partNumber, partName, quantity, unitCost, totalCost), totalCost, expectedDeliveryDate, and reasoning."""
+
+# Prompt skeleton for the parts ordering analysis; sections are rendered separately
+_CONTEXT_TEMPLATE = """# Parts Ordering Analysis Request
+
+## Work Order Information
+- Work Order ID: {work_order.id}
+- Machine ID: {work_order.machine_id}
+- Fault Type: {work_order.fault_type}
+- Priority: {work_order.priority}
+
+## Required Parts{required_parts}
+
+## Current Inventory Status
+{inventory}
+
+## Available Suppliers
+{suppliers}
+
+## Analysis Required
+Please provide a JSON response with:
+1. Parts to order
+2. Optimal supplier selection (reliability > lead time > cost)
+3. Expected delivery date
+4. Total order cost
+
+```json
+{{
+  "supplierId": "<supplier ID>",
+  "supplierName": "<supplier name>",
+  "orderItems": [
+    {{
+      "partNumber": "<part number>",
+      "partName": "<part name>",
+      "quantity": <number>,
+      "unitCost": <decimal>,
+      "totalCost": <decimal>
+    }}
+  ],
+  "totalCost": <decimal>,
+  "expectedDeliveryDate": "<ISO datetime>",
+  "reasoning": "<explanation>"
+}}
+```"""
+
+_REQUIRED_PART_TEMPLATE = """
+- **{part.part_name}** (Part#: {part.part_number})
+  * Quantity needed: {part.quantity}
+  * Available in stock: {available}"""
+
+_INVENTORY_TEMPLATE = """- **{item.part_name}** (Part#: {item.part_number})
+  * Current Stock: {item.current_stock}
+  * Minimum Stock: {item.min_stock}
+  * Reorder Point: {item.reorder_point}
+  * Status: {status}
+  * Location: {item.location}"""
+
+_SUPPLIER_TEMPLATE = """- **{supplier.name}** (ID: {supplier.id})
+  * Lead Time: {supplier.lead_time_days} days
+  * Reliability: {supplier.reliability}
+  * Contact: {supplier.contact_email}
+  * Parts Available: {parts}"""
+
+
+def _is_thread_not_found(error: BaseException) -> bool:
+    """Return True if error, or an error it wraps, is the service's 404 for a thread.
+
+    The agent client wraps the HTTP error from the model service, so the chain
+    of causes is walked looking for a 404 status.
+    """
+
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if getattr(error, "status_code", None) == 404:
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
 # =============================================================================
 # Agent Service
 # =============================================================================
@@ -43,61 +245,107 @@ load_dotenv(override=True)
 class PartsOrderingAgent:
     """AI Agent for parts ordering"""
 
-    def __init__(self, project_endpoint: str, deployment_name: str, cosmos_service: CosmosDbService):
+    def __init__(
+        self,
+        project_endpoint: str,
+        deployment_name: str,
+        cosmos_service: CosmosDbService,
+        project_client: Optional[AIProjectClient] = None,
+    ):
         self.project_endpoint = project_endpoint
         self.deployment_name = deployment_name
         self.cosmos_service = cosmos_service
 
+        # One client and agent for all work orders, so the token cache and HTTP
+        # connection pool survive between orders. Release with aclose().
+        if project_client is not None:
+            # Built on the caller's project client, reusing its credential. Model
+            # calls go through the OpenAI client it hands out, which keeps its own pool.
+            self._credential = None
+            self._chat_client = AzureAIClient(
+                project_client=project_client,
+                model_deployment_name=deployment_name,
+            )
+        else:
+            self._credential = DefaultAzureCredential()
+            self._chat_client = AzureAIClient(
+                project_endpoint=project_endpoint,
+                model_deployment_name=deployment_name,
+                credential=self._credential,
+            )
+        self._agent = self._chat_client.create_agent(
+            name="PartsOrderingAgent",
+            instructions=_ORDERING_INSTRUCTIONS,
+        )
+        # Background chat history writes still in flight; awaited by aclose()
+        self._pending_writes: Set[asyncio.Task] = set()
+
+    async def aclose(self):
+        """Finish pending history writes, then release the shared agent client
+        and the credential it created, if any.
+
+        Call it before closing the Cosmos service. A project client passed in by
+        the caller is left open.
+        """
+        if self._pending_writes:
+            await asyncio.gather(*self._pending_writes, return_exceptions=True)
+        await self._chat_client.close()
+        if self._credential is not None:
+            await self._credential.close()
+
     async def generate_order(
         self,
         work_order: WorkOrder,
         inventory: List[InventoryItem],
         suppliers: List[Supplier],
+        chat_history: Optional[WorkOrderChatHistory],
     ) -> PartsOrder:
-        """Generate optimized parts order using AI"""
+        """Generate optimized parts order using AI
+
+        chat_history is the work order's stored conversation, fetched by the
+        caller alongside the inventory and supplier lookups. If it carries an
+        agent thread id, that conversation is resumed and only the new turn is
+        sent; older records without one are replayed into the prompt.
+        """
 
         context = self._build_context(work_order, inventory, suppliers)
-        chat_history_json = await self.cosmos_service.get_work_order_chat_history(work_order.id)
-        print(
+        logger.info(
             f"   Using persistent chat history for work order: {work_order.id}")
 
-        instructions = """You are a parts ordering specialist for industrial tire manufacturing equipment.
-
-Analyze inventory status and optimize parts ordering from suppliers considering:
-1. Current inventory levels vs reorder points
-2. Supplier reliability, lead time, and cost
-3. Previous order history
-4. Order urgency based on work order priority
-
-Always respond in valid JSON format as requested."""
-
-        # Build context with chat history if available
+        thread_id = chat_history.thread_id if chat_history else None
         full_context = context
-        if chat_history_json:
+        if thread_id is None and chat_history and chat_history.history_json:
             try:
-                history_messages = json.loads(chat_history_json)
+                history_messages = _json_loads(chat_history.history_json)
                 history_text = "\n".join(
-                    f"{msg['role']}: {msg['content']}" for msg in history_messages
+                    f"{msg['role']}: {msg['content']}"
+                    for msg in history_messages[-_MAX_REPLAY_MESSAGES:]
                 )
                 full_context = f"Previous conversation:\n{history_text}\n\n{context}"
             except Exception as e:
-                print(f"   Warning: Could not restore chat history: {e}")
-
-        credential = DefaultAzureCredential()
+                logger.warning(f"   Warning: Could not restore chat history: {e}")
 
-        async with AzureAIClient(credential=credential).create_agent(
-            endpoint=self.project_endpoint,
-            model=self.deployment_name,
-            name="PartsOrderingAgent",
-            instructions=instructions,
-        ) as agent:
-            result = await agent.run(full_context)
-            response_text = result.text
-
-            await self._save_interaction_history(work_order.id, full_context, response_text)
+        thread = self._agent.get_new_thread(service_thread_id=thread_id)
+        try:
+            result = await self._agent.run(full_context, thread=thread)
+        except Exception as e:
+            # Only a conversation that no longer exists on the service is worth a
+            # second call; throttling, timeouts and auth errors would fail again
+            if thread_id is None or not _is_thread_not_found(e):
+                raise
+            logger.warning(f"   Warning: Could not resume agent thread {thread_id}: {e}")
+            thread = self._agent.get_new_thread()
+            result = await self._agent.run(full_context, thread=thread)
+        response_text = result.text
+
+        # The order does not depend on the history write, so don't wait for it
+        save_task = asyncio.create_task(self._save_interaction_history(
+            work_order.id, context, response_text, thread.service_thread_id))
+        self._pending_writes.add(save_task)
+        save_task.add_done_callback(self._pending_writes.discard)
 
         json_response = self._extract_json(response_text)
-        data = json.loads(json_response)
+        data = _json_loads(json_response)
 
         return PartsOrder(
             id=f"PO-{str(uuid.uuid4())[:8]}",
@@ -121,17 +369,24 @@ Always respond in valid JSON format as requested."""
             created_at=datetime.utcnow(),
         )
 
-    async def _save_interaction_history(self, work_order_id: str, user_context: str, assistant_response: str):
-        """Save interaction history to Cosmos DB"""
+    async def _save_interaction_history(
+        self,
+        work_order_id: str,
+        user_context: str,
+        assistant_response: str,
+        thread_id: Optional[str] = None,
+    ):
+        """Save interaction history (and the agent thread id) to Cosmos DB"""
 
         try:
             messages = [
                 {"role": "user", "content": user_context},
                 {"role": "assistant", "content": assistant_response},
             ]
-            await self.cosmos_service.save_work_order_chat_history(work_order_id, json.dumps(messages))
+            await self.cosmos_service.save_work_order_chat_history(
+                work_order_id, _json_dumps(messages), thread_id)
         except Exception as e:
-            print(f"   Warning: Could not save chat history: {e}")
+            logger.warning(f"   Warning: Could not save chat history: {e}")
 
     def _build_context(
         self,
@@ -141,104 +396,87 @@ Always respond in valid JSON format as requested."""
     ) -> str:
         """Build analysis context for AI"""
 
-        lines = [
-            "# Parts Ordering Analysis Request",
-            "",
-            "## Work Order Information",
-            f"- Work Order ID: {work_order.id}",
-            f"- Machine ID: {work_order.machine_id}",
-            f"- Fault Type: {work_order.fault_type}",
-            f"- Priority: {work_order.priority}",
-            "",
-            "## Required Parts",
-        ]
-
-        for part in work_order.required_parts:
-            lines.append(f"- **{part.part_name}** (Part#: {part.part_number})")
-            lines.append(f"  * Quantity needed: {part.quantity}")
-            lines.append(
-                f"  * Available in stock: {'YES' if part.is_available else 'NO'}")
-
-        lines.extend(["", "## Current Inventory Status"])
+        required_parts = "".join([
+            _REQUIRED_PART_TEMPLATE.format(
+                part=part, available="YES" if part.is_available else "NO")
+            for part in work_order.required_parts
+        ])
 
         if inventory:
-            for item in inventory:
-                needs_order = item.current_stock <= item.reorder_point
-                lines.append(
-                    f"- **{item.part_name}** (Part#: {item.part_number})")
-                lines.append(f"  * Current Stock: {item.current_stock}")
-                lines.append(f"  * Minimum Stock: {item.min_stock}")
-                lines.append(f"  * Reorder Point: {item.reorder_point}")
-                lines.append(
-                    f"  * Status: {'⚠️  NEEDS ORDERING' if needs_order else '✓ Adequate'}")
-                lines.append(f"  * Location: {item.location}")
+            inventory_status = "\n".join([
+                _INVENTORY_TEMPLATE.format(
+                    item=item,
+                    status="⚠️  NEEDS ORDERING" if item.current_stock <= item.reorder_point else "✓ Adequate",
+                )
+                for item in inventory
+            ])
         else:
-            lines.append("⚠️  No inventory records found for required parts.")
-
-        lines.extend(["", "## Available Suppliers"])
+            inventory_status = "⚠️  No inventory records found for required parts."
 
         if suppliers:
-            for supplier in suppliers:
-                lines.append(f"- **{supplier.name}** (ID: {supplier.id})")
-                lines.append(f"  * Lead Time: {supplier.lead_time_days} days")
-                lines.append(f"  * Reliability: {supplier.reliability}")
-                lines.append(f"  * Contact: {supplier.contact_email}")
-                parts_preview = ", ".join(supplier.parts[:5])
-                if len(supplier.parts) > 5:
-                    parts_preview += "..."
-                lines.append(f"  * Parts Available: {parts_preview}")
+            supplier_list = "\n".join([
+                _SUPPLIER_TEMPLATE.format(
+                    supplier=supplier,
+                    parts=", ".join(supplier.parts[:5]) +
+                    ("..." if len(supplier.parts) > 5 else ""),
+                )
+                for supplier in suppliers
+            ])
         else:
-            lines.append("⚠️  No suppliers found for required parts!")
-
-        lines.extend(
-            [
-                "",
-                "## Analysis Required",
-                "Please provide a JSON response with:",
-                "1. Parts to order",
-                "2. Optimal supplier selection (reliability > lead time > cost)",
-                "3. Expected delivery date",
-                "4. Total order cost",
-                "",
-                "```json",
-                "{",
-                '  "supplierId": "<supplier ID>",',
-                '  "supplierName": "<supplier name>",',
-                '  "orderItems": [',
-                "    {",
-                '      "partNumber": "<part number>",',
-                '      "partName": "<part name>",',
-                '      "quantity": <number>,',
-                '      "unitCost": <decimal>,',
-                '      "totalCost": <decimal>',
-                "    }",
-                "  ],",
-                '  "totalCost": <decimal>,',
-                '  "expectedDeliveryDate": "<ISO datetime>",',
-                '  "reasoning": "<explanation>"',
-                "}",
-                "```",
-            ]
-        )
+            supplier_list = "⚠️  No suppliers found for required parts!"
 
-        return "\n".join(lines)
+        return _CONTEXT_TEMPLATE.format(
+            work_order=work_order,
+            required_parts=required_parts,
+            inventory=inventory_status,
+            suppliers=supplier_list,
+        )
 
     def _extract_json(self, response: str) -> str:
         """Extract JSON from response"""
 
-        if "```json" in response:
-            start = response.index("```json") + 7
-            end = response.index("```", start)
-            return response[start:end].strip()
+        match = _JSON_FENCE_RE.search(response)
+        if match:
+            return match.group(1).strip()
 
-        start = response.find("{")
-        if start >= 0:
-            end = response.rfind("}")
-            return response[start: end + 1]
+        match = _JSON_OBJECT_RE.search(response)
+        if match:
+            return match.group(0)
 
         raise Exception("Could not extract JSON from agent response")
 
 
+async def get_project_client(
+    endpoint: str, http_session: Optional[aiohttp.ClientSession] = None
+) -> AIProjectClient:
+    """Return the shared AIProjectClient, creating it on first use.
+
+    Keeping one client (and credential) alive lets later calls reuse its token
+    cache and HTTPS connections. If http_session is given, the client sends its
+    requests through it. Close it with close_project_client().
+    """
+
+    global _CREDENTIAL, _PROJECT_CLIENT
+    if _PROJECT_CLIENT is None:
+        transport = None
+        if http_session is not None:
+            transport = shared_transport(http_session)
+        _CREDENTIAL = DefaultAzureCredential()
+        _PROJECT_CLIENT = AIProjectClient(
+            endpoint=endpoint, credential=_CREDENTIAL, transport=transport)
+    return _PROJECT_CLIENT
+
+
+async def close_project_client():
+    """Close the shared AIProjectClient and credential, if they were created."""
+
+    global _CREDENTIAL, _PROJECT_CLIENT
+    if _PROJECT_CLIENT is not None:
+        await _PROJECT_CLIENT.close()
+        await _CREDENTIAL.close()
+        _CREDENTIAL = _PROJECT_CLIENT = None
+
+
 # =============================================================================
 # Main Program
 # =============================================================================
@@ -247,178 +485,230 @@ Always respond in valid JSON format as requested."""
 async def main():
     """Main program"""
 
-    print("=== Parts Ordering Agent ===\n")
+    args = _PARSER.parse_args()
 
-    cosmos_endpoint = os.getenv("COSMOS_ENDPOINT")
-    cosmos_key = os.getenv("COSMOS_KEY")
-    database_name = os.getenv("COSMOS_DATABASE_NAME")
-    foundry_project_endpoint = os.getenv(
-        "AZURE_AI_PROJECT_ENDPOINT") or os.getenv("AI_FOUNDRY_PROJECT_ENDPOINT")
-    deployment_name = os.getenv("MODEL_DEPLOYMENT_NAME", "gpt-4o")
-    app_insights_connection = os.getenv(
-        "APPLICATIONINSIGHTS_CONNECTION_STRING")
+    logging.basicConfig(level=logging.INFO, format="%(message)s",
+                        handlers=[logging.StreamHandler(sys.stdout)])
+    logger.info("=== Parts Ordering Agent ===\n")
 
-    if not all([cosmos_endpoint, cosmos_key, database_name, foundry_project_endpoint]):
-        print("Error: Missing required environment variables.")
-        print("Required: COSMOS_ENDPOINT, COSMOS_KEY, COSMOS_DATABASE_NAME, AZURE_AI_PROJECT_ENDPOINT")
+    config = CONFIG
+    if config.missing:
+        logger.error("Error: Missing required environment variables.")
+        logger.error(f"Required: {', '.join(config.missing)}")
         return
+    for name in config.invalid:
+        logger.warning(f"⚠️  Invalid {name}={os.getenv(name)!r}; falling back to the minimum")
 
-    enable_tracing(app_insights_connection)
-
-    cosmos_service = CosmosDbService(
-        cosmos_endpoint, cosmos_key, database_name)
+    if not args.no_trace:
+        enable_tracing(config.app_insights_connection,
+                       traces_only=config.traces_only or args.traces_only)
 
-    # Register agent in Azure AI Foundry portal
     async with (
-        DefaultAzureCredential() as credential,
-        AIProjectClient(endpoint=foundry_project_endpoint, credential=credential) as project_client,
+        create_http_session() as http_session,
+        CosmosDbService(
+            config.cosmos_endpoint,
+            config.cosmos_key,
+            config.database_name,
+            transport=shared_transport(http_session),
+        ) as cosmos_service,
     ):
+        # The agent is built on the shared project client, so it uses the same
+        # credential as registration
+        project_client = await get_project_client(config.foundry_project_endpoint, http_session)
+        agent_service = PartsOrderingAgent(
+            config.foundry_project_endpoint,
+            config.deployment_name,
+            cosmos_service,
+            project_client=project_client,
+        )
         try:
-            from azure.ai.projects.models import PromptAgentDefinition
+            await run(
+                cosmos_service,
+                agent_service,
+                config,
+                args.work_order_ids,
+                register=config.register_agent or args.register_agent,
+                http_session=http_session,
+            )
+        finally:
+            await agent_service.aclose()
+            await close_project_client()
 
-            print("   Checking existing agent versions in portal...")
-            version_count = 0
-            try:
-                async for _ in project_client.agents.list_versions(agent_name="PartsOrderingAgent"):
-                    version_count += 1
-                print(f"   Found {version_count} existing versions")
-            except Exception as e:
-                print(f"   Error checking versions: {e}")
 
-            print(
-                f"   Creating new version (will be version #{version_count + 1})...")
+async def register_agent(project_client: AIProjectClient, deployment_name: str):
+    """Register a new PartsOrderingAgent version in Azure AI Foundry"""
 
-            definition = PromptAgentDefinition(
-                model=deployment_name,
-                instructions="""You are a Parts Ordering Specialist for industrial tire manufacturing equipment.
+    try:
+        from azure.ai.projects.models import PromptAgentDefinition
 
-Analyze inventory levels and optimize parts ordering from suppliers considering:
-1. Current inventory levels vs reorder points
-2. Supplier reliability, lead time, and cost
-3. Previous order history
-4. Order urgency based on work order priority
+        definition = PromptAgentDefinition(
+            model=deployment_name,
+            instructions=_AGENT_INSTRUCTIONS,
+        )
 
-When generating orders:
-- Prioritize suppliers with high reliability
-- Balance lead time against urgency
-- Consider total cost optimization
-- Reference inventory data to determine quantities
+        logger.info("   Registering PartsOrderingAgent in Azure AI Foundry portal...")
+        registered_agent = await project_client.agents.create_version(
+            agent_name="PartsOrderingAgent",
+            definition=definition,
+            description="Parts ordering automation agent",
+            metadata={
+                "framework": "agent-framework",
+                "purpose": "parts_ordering",
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+            },
+        )
+        logger.info("   ✅ New version created!")
+        logger.info(
+            f"      Agent ID: {registered_agent.id if hasattr(registered_agent, 'id') else 'N/A'}")
+        logger.info(f"      Version: {getattr(registered_agent, 'version', 'N/A')}")
+        logger.info("   Check portal at: https://ai.azure.com\n")
+    except Exception as e:
+        logger.exception(f"   ⚠️  Could not register agent in portal: {e}\n")
 
-Always respond in valid JSON format with: supplierId, supplierName, orderItems (partNumber, partName, quantity, unitCost, totalCost), totalCost, expectedDeliveryDate, and reasoning.""",
-            )
 
-            print("   Registering PartsOrderingAgent in Azure AI Foundry portal...")
-            registered_agent = await project_client.agents.create_version(
-                agent_name="PartsOrderingAgent",
-                definition=definition,
-                description="Parts ordering automation agent",
-                metadata={
-                    "framework": "agent-framework",
-                    "purpose": "parts_ordering",
-                    "timestamp": datetime.utcnow().isoformat(),
-                },
-            )
-            print("   ✅ New version created!")
-            print(
-                f"      Agent ID: {registered_agent.id if hasattr(registered_agent, 'id') else 'N/A'}")
-
-            print("   Verifying creation...")
-            verify_count = 0
-            async for _ in project_client.agents.list_versions(agent_name="PartsOrderingAgent"):
-                verify_count += 1
-            print(f"   Total versions now in portal: {verify_count}")
-            print("   Check portal at: https://ai.azure.com\n")
-        except Exception as e:
-            print(f"   ⚠️  Could not register agent in portal: {e}\n")
-            import traceback
+class _WorkOrderLogAdapter(logging.LoggerAdapter):
+    """Prefix each message with its work order ID, so concurrent runs can be told apart"""
+
+    def process(self, msg, kwargs):
+        return f"[{self.extra['work_order_id']}] {msg}", kwargs
 
-            print(f"   Error details: {traceback.format_exc()}")
-            logger.warning(f"Could not register agent in portal: {e}")
 
-    agent_service = PartsOrderingAgent(
-        foundry_project_endpoint, deployment_name, cosmos_service)
+async def run(
+    cosmos_service: CosmosDbService,
+    agent_service: PartsOrderingAgent,
+    config: Config,
+    work_order_ids: List[str],
+    register: bool = False,
+    http_session: Optional[aiohttp.ClientSession] = None,
+):
+    """Order parts for the requested work orders, registering the agent if asked"""
 
-    print("1. Retrieving work order...")
-    work_order_id = sys.argv[1] if len(sys.argv) > 1 else "2024-468"
+    await cosmos_service.ensure_containers("PartsOrders", "ChatHistories")
 
+    # Registering the agent in the portal is control-plane work, so it is opt-in
+    if register:
+        project_client = await get_project_client(config.foundry_project_endpoint, http_session)
+        await register_agent(project_client, config.deployment_name)
+
+    # Work orders are processed concurrently, at most PARTS_CONCURRENCY at a time,
+    # sharing the Cosmos client and the agent's connection pool
+    semaphore = asyncio.Semaphore(config.parts_concurrency)
+
+    async def run_one(work_order_id: str):
+        log = logger
+        if len(work_order_ids) > 1:
+            log = _WorkOrderLogAdapter(logger, {"work_order_id": work_order_id})
+        async with semaphore:
+            try:
+                await process_work_order(cosmos_service, agent_service, work_order_id, log)
+            except Exception:
+                # One failed work order must not cancel or hide the others
+                logger.exception(f"✗ Work order {work_order_id} failed")
+
+    await asyncio.gather(*(run_one(work_order_id) for work_order_id in work_order_ids))
+
+
+async def process_work_order(
+    cosmos_service: CosmosDbService,
+    agent_service: PartsOrderingAgent,
+    work_order_id: str,
+    log: Union[logging.Logger, logging.LoggerAdapter] = logger,
+):
+    """Order the parts a single work order still needs"""
+
+    log.info("1. Retrieving work order...")
     try:
         work_order = await cosmos_service.get_work_order(work_order_id)
-        print(f"   ✓ Work Order: {work_order.id}")
-        print(f"   Machine: {work_order.machine_id}")
-        print(f"   Required Parts: {len(work_order.required_parts)}")
-        print(f"   Priority: {work_order.priority}\n")
+        log.info(f"   ✓ Work Order: {work_order.id}")
+        log.info(f"   Machine: {work_order.machine_id}")
+        log.info(f"   Required Parts: {len(work_order.required_parts)}")
+        log.info(f"   Priority: {work_order.priority}\n")
     except Exception as e:
-        print(f"   ✗ Error: {str(e)}")
+        log.error(f"   ✗ Error: {str(e)}")
         return
 
-    print("2. Checking inventory status...")
-    part_numbers = [p.part_number for p in work_order.required_parts]
-    inventory = await cosmos_service.get_inventory_items(part_numbers)
-    print(f"   ✓ Found {len(inventory)} inventory records\n")
-
-    parts_needing_order = [
-        p for p in work_order.required_parts if not p.is_available]
+    parts_needing_order: List[RequiredPart] = []
+    needed_part_numbers: List[str] = []
+    for part in work_order.required_parts:
+        if not part.is_available:
+            parts_needing_order.append(part)
+            needed_part_numbers.append(part.part_number)
 
+    # Availability is recorded on the work order, so nothing else has to be
+    # read when every part is already in stock
     if not parts_needing_order:
-        print("✓ All required parts are available in stock!")
-        print("No parts order needed.\n")
+        log.info("✓ All required parts are available in stock!")
+        log.info("No parts order needed.\n")
 
-        print("3. Updating work order status...")
+        log.info("2. Updating work order status...")
         await cosmos_service.update_work_order_status(work_order.id, "Ready")
-        print("   ✓ Work order status updated to 'Ready'\n")
+        log.info("   ✓ Work order status updated to 'Ready'\n")
 
-        print("✓ Parts Ordering Agent completed successfully!")
+        log.info("✓ Parts Ordering Agent completed successfully!")
         return
 
-    print(f"⚠️  {len(parts_needing_order)} part(s) need to be ordered:")
+    log.info("2. Checking inventory status...")
+    # Inventory, suppliers and chat history only depend on the work order,
+    # so the three reads are issued together
+    inventory, suppliers, chat_history = await asyncio.gather(
+        cosmos_service.get_inventory_items(work_order.part_numbers),
+        cosmos_service.get_suppliers_for_parts(needed_part_numbers),
+        cosmos_service.get_work_order_chat_history(work_order.id),
+    )
+    log.info(f"   ✓ Found {len(inventory)} inventory records\n")
+
+    log.info(f"⚠️  {len(parts_needing_order)} part(s) need to be ordered:")
     for part in parts_needing_order:
-        print(f"   - {part.part_name} (Qty: {part.quantity})")
-    print()
+        log.info(f"   - {part.part_name} (Qty: {part.quantity})")
+    log.info("")
 
-    print("3. Finding suppliers...")
-    needed_part_numbers = [p.part_number for p in parts_needing_order]
-    suppliers = await cosmos_service.get_suppliers_for_parts(needed_part_numbers)
-    print(f"   ✓ Found {len(suppliers)} potential suppliers\n")
+    log.info("3. Finding suppliers...")
+    log.info(f"   ✓ Found {len(suppliers)} potential suppliers\n")
 
     if not suppliers:
-        print("✗ No suppliers found for required parts!")
+        log.error("✗ No suppliers found for required parts!")
         return
 
-    print("4. Running AI parts ordering analysis...")
+    log.info("4. Running AI parts ordering analysis...")
     try:
-        order = await agent_service.generate_order(work_order, inventory, suppliers)
-        print("   ✓ Parts order generated!\n")
-
-        print("=== Parts Order ===")
-        print(f"Order ID: {order.id}")
-        print(f"Work Order: {order.work_order_id}")
-        print(f"Supplier: {order.supplier_name} (ID: {order.supplier_id})")
-        print(
+        order = await agent_service.generate_order(work_order, inventory, suppliers, chat_history)
+        log.info("   ✓ Parts order generated!\n")
+
+        log.info("=== Parts Order ===")
+        log.info(f"Order ID: {order.id}")
+        log.info(f"Work Order: {order.work_order_id}")
+        log.info(f"Supplier: {order.supplier_name} (ID: {order.supplier_id})")
+        log.info(
             f"Expected Delivery: {order.expected_delivery_date.strftime('%Y-%m-%d')}")
-        print(f"Total Cost: ${order.total_cost:.2f}")
-        print(f"Status: {order.order_status}")
-        print("\nOrder Items:")
+        log.info(f"Total Cost: ${order.total_cost:.2f}")
+        log.info(f"Status: {order.order_status}")
+        log.info("\nOrder Items:")
         for item in order.order_items:
-            print(f"  - {item.part_name} (#{item.part_number})")
-            print(
+            log.info(f"  - {item.part_name} (#{item.part_number})")
+            log.info(
                 f"    Qty: {item.quantity} @ ${item.unit_cost:.2f} = ${item.total_cost:.2f}")
-        print()
-
-        print("5. Saving parts order...")
-        await cosmos_service.save_parts_order(order)
-        print("   ✓ Order saved to SCM system\n")
-
-        print("6. Updating work order status...")
-        await cosmos_service.update_work_order_status(work_order.id, "PartsOrdered")
-        print("   ✓ Work order status updated to 'PartsOrdered'\n")
+        log.info("")
+
+        log.info("5. Saving parts order and updating work order status...")
+        # The order and the work order live in different containers, so the two
+        # writes can't share a transactional batch; issue them together instead
+        await asyncio.gather(
+            cosmos_service.save_parts_order(order),
+            cosmos_service.update_work_order_status(work_order.id, "PartsOrdered"),
+        )
+        log.info("   ✓ Order saved to SCM system")
+        log.info("   ✓ Work order status updated to 'PartsOrdered'\n")
 
-        print("✓ Parts Ordering Agent completed successfully!")
+        log.info("✓ Parts Ordering Agent completed successfully!")
     except Exception as e:
-        print(f"   ✗ Error during parts ordering: {str(e)}")
-        import traceback
-
-        print(f"\nStack trace:\n{traceback.format_exc()}")
+        log.exception(f"   ✗ Error during parts ordering: {str(e)}")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        import uvloop
+    except ImportError:  # uvloop is optional (and unavailable on Windows)
+        asyncio.run(main())
+    else:
+        # uvloop.install() is deprecated from Python 3.12; run() sets up the loop itself
+        uvloop.run(main())
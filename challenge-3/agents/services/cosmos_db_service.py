@@ -7,18 +7,51 @@ used in the workshop.
 
 from __future__ import annotations
 
+import asyncio
+import logging
+import re
 from dataclasses import dataclass, field
-from datetime import datetime, timedelta
-from typing import List, Optional
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from azure.cosmos import PartitionKey, exceptions
+from azure.cosmos.aio import CosmosClient
+
+logger = logging.getLogger(__name__)
+
+# Transactional batches are limited to 100 operations per partition key.
+_MAX_BATCH_OPERATIONS = 100
+
+# How long to wait before re-seeding mock maintenance windows.
+_MOCK_WINDOWS_SEED_TTL = timedelta(minutes=10)
+
+# Part lookups at least this large are split into one query per feed range.
+_FEED_RANGE_FAN_OUT_MIN_PARTS = 10
+
+# Work order status values that may be written. The status is spliced into the
+# patch filter predicate, which does not take query parameters.
+_WORK_ORDER_STATUS_RE = re.compile(r"[A-Za-z0-9_\- ]+")
+
+# Containers the agents write to that may not exist yet, with their partition key paths.
+_WRITE_CONTAINERS = {
+    "MaintenanceSchedules": "/id",
+    "MaintenanceWindows": "/isAvailable",
+    "ChatHistories": "/entityId",
+    "PartsOrders": "/id",
+}
+
+
+def _drop_none(item: dict) -> dict:
+    """Drop top-level None values so they are not stored (and billed) in Cosmos."""
+    return {k: v for k, v in item.items() if v is not None}
 
-from azure.cosmos import CosmosClient, PartitionKey, exceptions
 
 # =============================================================================
 # Shared Models
 # =============================================================================
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class RequiredPart:
     """Part required for maintenance"""
 
@@ -28,7 +61,7 @@ class RequiredPart:
     is_available: bool = False
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class WorkOrder:
     """Work order from the Repair Planner Agent"""
 
@@ -41,6 +74,12 @@ class WorkOrder:
     estimated_duration: int = 0
     created_at: Optional[datetime] = None
     status: str = "Created"
+    # Derived from required_parts once, for the inventory lookup
+    part_numbers: List[str] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(
+            self, "part_numbers", [p.part_number for p in self.required_parts])
 
 
 # =============================================================================
@@ -93,7 +132,7 @@ class MaintenanceHistory:
 # =============================================================================
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class InventoryItem:
     """Inventory item from WMS"""
 
@@ -106,7 +145,7 @@ class InventoryItem:
     location: str = ""
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Supplier:
     """Supplier information from SCM"""
 
@@ -118,7 +157,28 @@ class Supplier:
     contact_email: str = ""
 
 
-@dataclass
+# Fallback suppliers used when none match the requested parts
+_MOCK_SUPPLIERS = (
+    Supplier(
+        id="supplier-001",
+        name="Industrial Parts Supply Co.",
+        parts=[],
+        reliability="High",
+        lead_time_days=3,
+        contact_email="orders@industrialparts.com",
+    ),
+    Supplier(
+        id="supplier-002",
+        name="Quick Parts Ltd.",
+        parts=[],
+        reliability="Medium",
+        lead_time_days=1,
+        contact_email="sales@quickparts.com",
+    ),
+)
+
+
+@dataclass(slots=True, frozen=True)
 class OrderItem:
     """Individual item in a parts order"""
 
@@ -129,7 +189,7 @@ class OrderItem:
     total_cost: float = 0.0
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class PartsOrder:
     """Parts order for SCM system"""
 
@@ -144,18 +204,70 @@ class PartsOrder:
     created_at: Optional[datetime] = None
 
 
+@dataclass
+class WorkOrderChatHistory:
+    """Stored agent conversation for a work order"""
+
+    history_json: Optional[str] = None
+    thread_id: Optional[str] = None
+
+
 # =============================================================================
 # Cosmos DB Service
 # =============================================================================
 
 
 class CosmosDbService:
-    """Service for interacting with Cosmos DB."""
-
-    def __init__(self, endpoint: str, key: str, database_name: str):
-        self.client = CosmosClient(endpoint, key)
+    """Service for interacting with Cosmos DB.
+
+    Uses the async Cosmos client so requests do not block the event loop. A
+    single client (and its connection pool) is shared by every call; close it
+    with close() or by using the service as an async context manager.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        key: str,
+        database_name: str,
+        transport=None,
+        work_orders_partition_key_path: str = "/status",
+    ):
+        # transport optionally supplies a pre-configured HTTP transport (and pool)
+        self.client = CosmosClient(endpoint, key, transport=transport)
         self.database = self.client.get_database_client(database_name)
 
+        # Container clients are resolved once and reused by every call
+        self.work_orders = self.database.get_container_client("WorkOrders")
+        self.maintenance_history = self.database.get_container_client(
+            "MaintenanceHistory")
+        self.maintenance_windows = self.database.get_container_client(
+            "MaintenanceWindows")
+        self.maintenance_schedules = self.database.get_container_client(
+            "MaintenanceSchedules")
+        self.inventory = self.database.get_container_client("PartsInventory")
+        self.suppliers = self.database.get_container_client("Suppliers")
+        self.parts_orders = self.database.get_container_client("PartsOrders")
+        self.chat_histories = self.database.get_container_client(
+            "ChatHistories")
+
+        self._ensured_containers: set = set()
+        self._mock_windows_seeded_at: Optional[datetime] = None
+        # WorkOrders partition key path; challenge-0/seed-data.sh partitions by /status
+        self._work_orders_pk_path = work_orders_partition_key_path
+        # Work order id -> partition key value, learned from earlier reads/writes
+        self._work_order_partitions: Dict[str, str] = {}
+
+    async def __aenter__(self) -> "CosmosDbService":
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        """Close the underlying Cosmos client."""
+        await self.client.close()
+
     def _parse_datetime(self, dt_value):
         """Parse datetime from ISO string."""
         if isinstance(dt_value, datetime):
@@ -167,46 +279,114 @@ class CosmosDbService:
         except Exception:
             return None
 
-    def _ensure_container(self, container_id: str, partition_key_path: str):
-        """Ensure a Cosmos container exists and return a usable container client.
+    async def ensure_containers(self, *container_ids: str):
+        """Create any of the agents' write containers that do not exist yet.
 
-        Note: get_container_client() does not validate existence; the NotFound shows
-        up later when you try to read/write items.
+        Call once at startup with the containers the caller writes to (all of
+        them by default). Containers already ensured by this service are skipped.
         """
 
-        container = self.database.get_container_client(container_id)
-        try:
-            container.read()  # force a service call to validate container exists
-            return container
-        except exceptions.CosmosResourceNotFoundError:
+        missing = [
+            container_id
+            for container_id in container_ids or _WRITE_CONTAINERS
+            if container_id not in self._ensured_containers
+        ]
+        await asyncio.gather(*(
             self.database.create_container_if_not_exists(
                 id=container_id,
-                partition_key=PartitionKey(path=partition_key_path),
+                partition_key=PartitionKey(
+                    path=_WRITE_CONTAINERS[container_id]),
             )
-            return self.database.get_container_client(container_id)
+            for container_id in missing
+        ))
+        self._ensured_containers.update(missing)
+
+    async def _query_across_partitions(
+        self, container, query: str, parameters: List[dict], fan_out: bool = False
+    ) -> List[dict]:
+        """Run a cross-partition query and return every matching item.
+
+        With fan_out, the query is issued once per feed range and the ranges are
+        read concurrently instead of one partition after another. Only use it for
+        queries without TOP or ORDER BY, since results are simply concatenated.
+        """
+
+        if not fan_out:
+            return [
+                item
+                # Without a partition_key the aio client queries every partition
+                async for item in container.query_items(query=query, parameters=parameters)
+            ]
+
+        async def query_range(feed_range) -> List[dict]:
+            return [
+                item
+                async for item in container.query_items(
+                    query=query, parameters=parameters, feed_range=feed_range)
+            ]
+
+        try:
+            # The aio read_feed_ranges() is an async generator (azure-cosmos >= 4.7)
+            feed_ranges = [feed_range async for feed_range in container.read_feed_ranges()]
+            pages = await asyncio.gather(*(query_range(fr) for fr in feed_ranges))
+        except Exception as e:
+            logger.warning(f"Feed range fan-out failed, querying across partitions instead: {e}")
+            return await self._query_across_partitions(container, query, parameters)
+        return [item for page in pages for item in page]
 
     # -------------------------------------------------------------------------
     # Work orders
     # -------------------------------------------------------------------------
 
-    async def get_work_order(self, work_order_id: str) -> WorkOrder:
-        """Get work order from ERP system."""
+    async def _get_work_order_raw(
+        self, work_order_id: str, full_document: bool = False
+    ) -> Optional[dict]:
+        """Fetch the raw work order document, preferring a point read.
 
-        container = self.database.get_container_client("WorkOrders")
-        try:
+        A point read needs the partition key: the id itself when the container
+        is partitioned by /id, otherwise the status remembered from an earlier
+        read. Without one (or if the document has moved) a single-row query is
+        streamed instead; it projects only the fields get_work_order maps unless
+        full_document is set.
+        """
+
+        container = self.work_orders
+        if self._work_orders_pk_path == "/id":
+            partition_key = work_order_id
+        else:
+            partition_key = self._work_order_partitions.get(work_order_id)
+
+        if partition_key is not None:
+            try:
+                return await container.read_item(
+                    item=work_order_id, partition_key=partition_key)
+            except exceptions.CosmosResourceNotFoundError:
+                pass
+
+        if full_document:
             query = "SELECT * FROM c WHERE c.id = @id"
-            items = list(
-                container.query_items(
-                    query=query,
-                    parameters=[{"name": "@id", "value": work_order_id}],
-                    enable_cross_partition_query=True,
-                )
+        else:
+            query = (
+                "SELECT c.id, c.machineId, c.faultType, c.priority, c.assignedTechnician, "
+                "c.requiredParts, c.estimatedDuration, c.createdAt, c.status "
+                "FROM c WHERE c.id = @id"
             )
+        async for item in container.query_items(
+            query=query,
+            parameters=[{"name": "@id", "value": work_order_id}],
+        ):
+            return item
+        return None
+
+    async def get_work_order(self, work_order_id: str) -> WorkOrder:
+        """Get work order from ERP system."""
 
-            if not items:
+        try:
+            item = await self._get_work_order_raw(work_order_id)
+            if item is None:
                 raise Exception(f"Work order {work_order_id} not found")
 
-            item = items[0]
+            self._work_order_partitions[work_order_id] = item.get("status", "")
             return WorkOrder(
                 id=item.get("id", ""),
                 machine_id=item.get("machineId", ""),
@@ -230,35 +410,45 @@ class CosmosDbService:
             raise Exception(f"Work order {work_order_id} not found: {str(e)}")
 
     async def update_work_order_status(self, work_order_id: str, status: str):
-        """Update work order status."""
+        """Update work order status.
 
-        container = self.database.get_container_client("WorkOrders")
-        work_order = await self.get_work_order(work_order_id)
-        old_status = work_order.status
-
-        container.delete_item(item=work_order_id, partition_key=old_status)
-
-        item = {
-            "id": work_order.id,
-            "machineId": work_order.machine_id,
-            "faultType": work_order.fault_type,
-            "priority": work_order.priority,
-            "assignedTechnician": work_order.assigned_technician,
-            "requiredParts": [
-                {
-                    "partNumber": p.part_number,
-                    "partName": p.part_name,
-                    "quantity": p.quantity,
-                    "isAvailable": p.is_available,
-                }
-                for p in work_order.required_parts
-            ],
-            "estimatedDuration": work_order.estimated_duration,
-            "createdAt": work_order.created_at.isoformat() if work_order.created_at else None,
-            "status": status,
-        }
+        If the container is partitioned by id, only the status field is sent as a
+        patch. The workshop container is partitioned by /status, and a partition
+        key value cannot be patched, so there the document is moved to its new
+        partition instead.
+        """
 
-        container.upsert_item(body=item)
+        if not _WORK_ORDER_STATUS_RE.fullmatch(status):
+            raise ValueError(f"Invalid work order status: {status!r}")
+
+        container = self.work_orders
+        if self._work_orders_pk_path == "/id":
+            try:
+                # Conditional patch: nothing is written if the status already matches
+                await container.patch_item(
+                    item=work_order_id,
+                    partition_key=work_order_id,
+                    patch_operations=[
+                        {"op": "set", "path": "/status", "value": status}],
+                    filter_predicate=f"FROM c WHERE c.status != '{status}'",
+                )
+            except exceptions.CosmosAccessConditionFailedError:
+                pass
+            return
+
+        raw = await self._get_work_order_raw(work_order_id, full_document=True)
+        if raw is None:
+            raise Exception(f"Work order {work_order_id} not found")
+        old_status = raw.get("status")
+
+        # Write the document under its new partition first, then remove the old
+        # copy; system properties (_rid, _etag, ...) are left for Cosmos to assign
+        item = {k: v for k, v in raw.items() if not k.startswith("_")}
+        item["status"] = status
+        await container.upsert_item(body=item)
+        if old_status != status:
+            await container.delete_item(item=work_order_id, partition_key=old_status)
+        self._work_order_partitions[work_order_id] = status
 
     # -------------------------------------------------------------------------
     # Maintenance data
@@ -268,19 +458,21 @@ class CosmosDbService:
         """Get historical maintenance records for a machine."""
 
         try:
-            container = self.database.get_container_client(
-                "MaintenanceHistory")
+            container = self.maintenance_history
             query = (
-                "SELECT * FROM c WHERE c.machineId = @machineId "
+                "SELECT c.id, c.machineId, c.faultType, c.occurrenceDate, "
+                "c.resolutionDate, c.downtime, c.cost "
+                "FROM c WHERE c.machineId = @machineId "
                 "ORDER BY c.occurrenceDate DESC"
             )
-            items = list(
-                container.query_items(
+            items = [
+                item
+                async for item in container.query_items(
                     query=query,
                     parameters=[{"name": "@machineId", "value": machine_id}],
-                    enable_cross_partition_query=True,
+                    partition_key=machine_id,
                 )
-            )
+            ]
 
             results: List[MaintenanceHistory] = []
             for item in items:
@@ -300,36 +492,38 @@ class CosmosDbService:
 
             return results
         except Exception as e:
-            print(f"Warning: Could not retrieve maintenance history: {str(e)}")
+            logger.warning(f"Warning: Could not retrieve maintenance history: {str(e)}")
             return []
 
     async def get_available_maintenance_windows(self, days_ahead: int = 14) -> List[MaintenanceWindow]:
         """Get available maintenance windows from MES."""
 
         try:
-            container = self.database.get_container_client(
-                "MaintenanceWindows")
+            container = self.maintenance_windows
             start_date = datetime.utcnow()
             end_date = start_date + timedelta(days=days_ahead)
 
             query = (
-                "SELECT * FROM c "
+                "SELECT c.id, c.startTime, c.endTime, c.productionImpact, c.isAvailable "
+                "FROM c "
                 "WHERE c.startTime >= @startDate "
                 "AND c.startTime <= @endDate "
                 "AND c.isAvailable = true "
                 "ORDER BY c.startTime"
             )
 
-            items = list(
-                container.query_items(
+            items = [
+                item
+                async for item in container.query_items(
                     query=query,
                     parameters=[
                         {"name": "@startDate", "value": start_date.isoformat()},
                         {"name": "@endDate", "value": end_date.isoformat()},
                     ],
-                    enable_cross_partition_query=True,
+                    # Only available windows are wanted, and that is the partition key
+                    partition_key=True,
                 )
-            )
+            ]
 
             results: List[MaintenanceWindow] = []
             for item in items:
@@ -343,9 +537,12 @@ class CosmosDbService:
                     )
                 )
 
-            return results if results else self._generate_mock_windows(days_ahead)
+            if results:
+                return results
+
+            return await self.seed_mock_windows(days_ahead)
         except Exception as e:
-            print(f"Warning: Could not retrieve maintenance windows: {str(e)}")
+            logger.warning(f"Warning: Could not retrieve maintenance windows: {str(e)}")
             return self._generate_mock_windows(days_ahead)
 
     def _generate_mock_windows(self, days_ahead: int) -> List[MaintenanceWindow]:
@@ -372,10 +569,53 @@ class CosmosDbService:
 
         return windows
 
+    async def seed_mock_windows(self, days_ahead: int = 14) -> List[MaintenanceWindow]:
+        """Persist mock maintenance windows so later queries can find them.
+
+        Windows are written with one transactional batch per partition key
+        instead of one request per window. Seeding is skipped while a previous
+        seed is still considered fresh.
+        """
+
+        windows = self._generate_mock_windows(days_ahead)
+        now = datetime.utcnow()
+        if self._mock_windows_seeded_at and now - self._mock_windows_seeded_at < _MOCK_WINDOWS_SEED_TTL:
+            return windows
+
+        try:
+            await self.ensure_containers("MaintenanceWindows")
+            container = self.maintenance_windows
+
+            batches: Dict[bool, List[dict]] = {}
+            for window in windows:
+                item = {
+                    "id": window.id,
+                    "startTime": window.start_time.isoformat(),
+                    "endTime": window.end_time.isoformat(),
+                    "productionImpact": window.production_impact,
+                    "isAvailable": window.is_available,
+                }
+                batches.setdefault(window.is_available, []).append(item)
+
+            for partition_key, items in batches.items():
+                for i in range(0, len(items), _MAX_BATCH_OPERATIONS):
+                    await container.execute_item_batch(
+                        batch_operations=[
+                            ("upsert", (item,)) for item in items[i: i + _MAX_BATCH_OPERATIONS]
+                        ],
+                        partition_key=partition_key,
+                    )
+
+            self._mock_windows_seeded_at = now
+        except Exception as e:
+            logger.warning(f"Warning: Could not seed maintenance windows: {str(e)}")
+
+        return windows
+
     async def save_maintenance_schedule(self, schedule: MaintenanceSchedule) -> MaintenanceSchedule:
         """Save maintenance schedule to database."""
 
-        container = self._ensure_container("MaintenanceSchedules", "/id")
+        container = self.maintenance_schedules
 
         item = {
             "id": schedule.id,
@@ -406,15 +646,15 @@ class CosmosDbService:
             "createdAt": schedule.created_at.isoformat() if schedule.created_at else None,
         }
 
-        container.upsert_item(body=item)
+        await container.upsert_item(body=item)
         return schedule
 
     async def get_machine_chat_history(self, machine_id: str) -> Optional[str]:
         """Get chat history for a machine."""
 
         try:
-            container = self.database.get_container_client("ChatHistories")
-            item = container.read_item(
+            container = self.chat_histories
+            item = await container.read_item(
                 item=machine_id, partition_key=machine_id)
             return item.get("historyJson")
         except exceptions.CosmosResourceNotFoundError:
@@ -425,7 +665,7 @@ class CosmosDbService:
     async def save_machine_chat_history(self, machine_id: str, history_json: str):
         """Save chat history for a machine."""
 
-        container = self._ensure_container("ChatHistories", "/entityId")
+        container = self.chat_histories
 
         item = {
             "id": machine_id,
@@ -433,10 +673,10 @@ class CosmosDbService:
             "entityType": "machine",
             "historyJson": history_json,
             "purpose": "predictive_maintenance",
-            "updatedAt": datetime.utcnow().isoformat(),
+            "updatedAt": datetime.now(timezone.utc).isoformat(),
         }
 
-        container.upsert_item(body=item)
+        await container.upsert_item(body=item)
 
     # -------------------------------------------------------------------------
     # Inventory / suppliers
@@ -446,94 +686,85 @@ class CosmosDbService:
         """Get inventory items from WMS."""
 
         try:
-            container = self.database.get_container_client("PartsInventory")
-            results: List[InventoryItem] = []
+            container = self.inventory
+            query = (
+                "SELECT * FROM c "
+                "WHERE ARRAY_CONTAINS(@partNumbers, c.partNumber) "
+                "OR ARRAY_CONTAINS(@partNumbers, c.id)"
+            )
+            items = await self._query_across_partitions(
+                container,
+                query,
+                [{"name": "@partNumbers", "value": part_numbers}],
+                fan_out=len(part_numbers) >= _FEED_RANGE_FAN_OUT_MIN_PARTS,
+            )
 
-            for part_number in part_numbers:
-                query = (
-                    "SELECT * FROM c WHERE c.partNumber = @partNumber OR c.id = @partNumber"
-                )
-                items = list(
-                    container.query_items(
-                        query=query,
-                        parameters=[
-                            {"name": "@partNumber", "value": part_number}],
-                        enable_cross_partition_query=True,
+            results: List[InventoryItem] = []
+            for item in items:
+                results.append(
+                    InventoryItem(
+                        id=item.get("id", ""),
+                        part_number=item.get("partNumber", ""),
+                        part_name=item.get("partName", ""),
+                        current_stock=item.get("currentStock", 0),
+                        min_stock=item.get("minStock", 0),
+                        reorder_point=item.get("reorderPoint", 0),
+                        location=item.get("location", ""),
                     )
                 )
 
-                for item in items:
-                    results.append(
-                        InventoryItem(
-                            id=item.get("id", ""),
-                            part_number=item.get("partNumber", ""),
-                            part_name=item.get("partName", ""),
-                            current_stock=item.get("currentStock", 0),
-                            min_stock=item.get("minStock", 0),
-                            reorder_point=item.get("reorderPoint", 0),
-                            location=item.get("location", ""),
-                        )
-                    )
-
             return results
         except Exception as e:
-            print(f"Warning: Could not retrieve inventory: {str(e)}")
+            logger.warning(f"Warning: Could not retrieve inventory: {str(e)}")
             return []
 
     async def get_suppliers_for_parts(self, part_numbers: List[str]) -> List[Supplier]:
         """Get suppliers from SCM that can provide specific parts."""
 
         try:
-            container = self.database.get_container_client("Suppliers")
-            items = list(container.query_items(
-                query="SELECT * FROM c", enable_cross_partition_query=True))
+            container = self.suppliers
+            query = (
+                "SELECT * FROM c "
+                "WHERE EXISTS(SELECT VALUE p FROM p IN c.parts WHERE ARRAY_CONTAINS(@partNumbers, p))"
+            )
+            items = await self._query_across_partitions(
+                container,
+                query,
+                [{"name": "@partNumbers", "value": part_numbers}],
+                fan_out=len(part_numbers) >= _FEED_RANGE_FAN_OUT_MIN_PARTS,
+            )
 
             results: List[Supplier] = []
             for item in items:
-                supplier_parts = item.get("parts", [])
-                if any(part in supplier_parts for part in part_numbers):
-                    results.append(
-                        Supplier(
-                            id=item.get("id", ""),
-                            name=item.get("name", ""),
-                            parts=supplier_parts,
-                            lead_time_days=item.get("leadTimeDays", 0),
-                            reliability=item.get("reliability", ""),
-                            contact_email=item.get("contactEmail", ""),
-                        )
+                results.append(
+                    Supplier(
+                        id=item.get("id", ""),
+                        name=item.get("name", ""),
+                        parts=item.get("parts", []),
+                        lead_time_days=item.get("leadTimeDays", 0),
+                        reliability=item.get("reliability", ""),
+                        contact_email=item.get("contactEmail", ""),
                     )
+                )
 
             return results if results else self._generate_mock_suppliers()
         except Exception as e:
-            print(f"Warning: Could not retrieve suppliers: {str(e)}")
+            logger.warning(f"Warning: Could not retrieve suppliers: {str(e)}")
             return self._generate_mock_suppliers()
 
     def _generate_mock_suppliers(self) -> List[Supplier]:
         """Generate mock suppliers."""
 
-        return [
-            Supplier(
-                id="supplier-001",
-                name="Industrial Parts Supply Co.",
-                parts=[],
-                reliability="High",
-                lead_time_days=3,
-                contact_email="orders@industrialparts.com",
-            ),
-            Supplier(
-                id="supplier-002",
-                name="Quick Parts Ltd.",
-                parts=[],
-                reliability="Medium",
-                lead_time_days=1,
-                contact_email="sales@quickparts.com",
-            ),
-        ]
+        return list(_MOCK_SUPPLIERS)
 
     async def save_parts_order(self, order: PartsOrder) -> PartsOrder:
         """Save parts order to SCM."""
 
-        container = self._ensure_container("PartsOrders", "/id")
+        container = self.parts_orders
+        delivery_iso = (
+            order.expected_delivery_date.isoformat() if order.expected_delivery_date else None
+        )
+        created_iso = order.created_at.isoformat() if order.created_at else None
 
         item = {
             "id": order.id,
@@ -551,41 +782,49 @@ class CosmosDbService:
             "supplierId": order.supplier_id,
             "supplierName": order.supplier_name,
             "totalCost": order.total_cost,
-            "expectedDeliveryDate": order.expected_delivery_date.isoformat()
-            if order.expected_delivery_date
-            else None,
+            "expectedDeliveryDate": delivery_iso,
             "orderStatus": order.order_status,
-            "createdAt": order.created_at.isoformat() if order.created_at else None,
+            "createdAt": created_iso,
         }
 
-        container.upsert_item(body=item)
+        await container.upsert_item(body=_drop_none(item))
         return order
 
-    async def get_work_order_chat_history(self, work_order_id: str) -> Optional[str]:
+    async def get_work_order_chat_history(self, work_order_id: str) -> Optional[WorkOrderChatHistory]:
         """Get chat history for a work order."""
 
         try:
-            container = self.database.get_container_client("ChatHistories")
-            item = container.read_item(
+            container = self.chat_histories
+            item = await container.read_item(
                 item=work_order_id, partition_key=work_order_id)
-            return item.get("historyJson")
+            return WorkOrderChatHistory(
+                history_json=item.get("historyJson"),
+                thread_id=item.get("threadId"),
+            )
         except exceptions.CosmosResourceNotFoundError:
             return None
         except Exception:
             return None
 
-    async def save_work_order_chat_history(self, work_order_id: str, history_json: str):
-        """Save chat history for a work order."""
+    async def save_work_order_chat_history(
+        self, work_order_id: str, history_json: str, thread_id: Optional[str] = None
+    ):
+        """Save chat history for a work order.
+
+        thread_id is the agent service's conversation id; when present the next
+        run resumes that conversation instead of replaying history_json.
+        """
 
-        container = self._ensure_container("ChatHistories", "/entityId")
+        container = self.chat_histories
 
         item = {
             "id": work_order_id,
             "entityId": work_order_id,
             "entityType": "workorder",
             "historyJson": history_json,
+            "threadId": thread_id,
             "purpose": "parts_ordering",
-            "updatedAt": datetime.utcnow().isoformat(),
+            "updatedAt": datetime.now(timezone.utc).isoformat(),
         }
 
-        container.upsert_item(body=item)
+        await container.upsert_item(body=_drop_none(item))
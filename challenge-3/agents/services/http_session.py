@@ -0,0 +1,36 @@
+"""Shared HTTP connection pool for the Azure clients used by Challenge 3 agents."""
+
+from __future__ import annotations
+
+import aiohttp
+from azure.core.pipeline.transport import AioHttpTransport
+
+# Connection pool shared by the Cosmos and Foundry project clients
+_HTTP_POOL_LIMIT = 200
+_HTTP_POOL_LIMIT_PER_HOST = 100
+_HTTP_KEEPALIVE_SECONDS = 120
+_HTTP_DNS_CACHE_SECONDS = 300
+
+
+def create_http_session() -> aiohttp.ClientSession:
+    """Create an aiohttp session with a connection pool sized for concurrent runs.
+
+    The SDK defaults keep a small pool and drop idle connections after 15s,
+    which serializes concurrent work orders on a few sockets. Create it inside
+    the running event loop and close it after every client using it.
+    """
+
+    connector = aiohttp.TCPConnector(
+        limit=_HTTP_POOL_LIMIT,
+        limit_per_host=_HTTP_POOL_LIMIT_PER_HOST,
+        keepalive_timeout=_HTTP_KEEPALIVE_SECONDS,
+        ttl_dns_cache=_HTTP_DNS_CACHE_SECONDS,
+        enable_cleanup_closed=True,
+    )
+    return aiohttp.ClientSession(connector=connector)
+
+
+def shared_transport(session: aiohttp.ClientSession) -> AioHttpTransport:
+    """Wrap session in a transport that leaves closing the session to its owner."""
+
+    return AioHttpTransport(session=session, session_owner=False)
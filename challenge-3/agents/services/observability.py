@@ -2,19 +2,43 @@
 
 from __future__ import annotations
 
-from typing import Optional
+from functools import lru_cache
+from typing import Optional, Tuple
 
 
-def enable_tracing(app_insights_connection: Optional[str]) -> None:
-    """Enable Agent Framework tracing (Azure Monitor exporter) if available."""
+@lru_cache(maxsize=None)
+def _otel_exporters(app_insights_connection: str, traces_only: bool) -> Tuple:
+    """Build (once per connection string) the Azure Monitor exporters to register.
+
+    Each exporter runs its own background export thread, so the metric and log
+    exporters are skipped when only traces are wanted.
+    """
+
+    from azure.monitor.opentelemetry.exporter import (
+        AzureMonitorLogExporter,
+        AzureMonitorMetricExporter,
+        AzureMonitorTraceExporter,
+    )
+
+    exporters = [AzureMonitorTraceExporter.from_connection_string(
+        app_insights_connection)]
+    if not traces_only:
+        exporters.append(AzureMonitorMetricExporter.from_connection_string(
+            app_insights_connection))
+        exporters.append(AzureMonitorLogExporter.from_connection_string(
+            app_insights_connection))
+    return tuple(exporters)
+
+
+def enable_tracing(app_insights_connection: Optional[str], traces_only: bool = False) -> None:
+    """Enable Agent Framework tracing (Azure Monitor exporter) if available.
+
+    With traces_only, metrics and logs are not exported.
+    """
 
     try:
         from agent_framework.observability import configure_otel_providers
-        from azure.monitor.opentelemetry.exporter import (
-            AzureMonitorLogExporter,
-            AzureMonitorMetricExporter,
-            AzureMonitorTraceExporter,
-        )
+        import azure.monitor.opentelemetry.exporter  # noqa: F401
     except ImportError:
         print("⚠️  Agent Framework observability not available.")
         return
@@ -24,19 +48,13 @@ def enable_tracing(app_insights_connection: Optional[str]) -> None:
         return
 
     try:
-        trace_exporter = AzureMonitorTraceExporter.from_connection_string(
-            app_insights_connection)
-        metric_exporter = AzureMonitorMetricExporter.from_connection_string(
-            app_insights_connection)
-        log_exporter = AzureMonitorLogExporter.from_connection_string(
-            app_insights_connection)
-
         configure_otel_providers(
             enable_sensitive_data=True,  # Capture prompts and completions
-            exporters=[trace_exporter, metric_exporter, log_exporter],
+            exporters=list(_otel_exporters(app_insights_connection, traces_only)),
         )
         print("📊 Agent Framework tracing enabled (Azure Monitor)")
-        print(f"   Traces sent to: {app_insights_connection.split(';')[0]}")
+        destination, _, _ = app_insights_connection.partition(";")
+        print(f"   Traces sent to: {destination}")
         print("   View in Azure AI Foundry portal: https://ai.azure.com -> Your Project -> Tracing\n")
     except Exception as e:
         print(f"⚠️  Tracing setup failed: {e}\n")
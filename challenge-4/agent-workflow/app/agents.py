@@ -1,6 +1,7 @@
 from dotenv import load_dotenv
 from agent_framework import WorkflowBuilder, Executor, handler, WorkflowContext
 
+import asyncio
 import os
 import sys
 import re
@@ -105,35 +106,39 @@ def create_maintenance_scheduler_a2a_app():
                 if not all([cosmos_endpoint, cosmos_key, database_name, project_endpoint]):
                     response_text = "Error: Missing required environment variables for MaintenanceSchedulerAgent"
                 else:
-                    cosmos_service = CosmosDbService(cosmos_endpoint, cosmos_key, database_name)
-                    agent = MaintenanceSchedulerAgent(project_endpoint, deployment_name, cosmos_service)
-
-                    # Parse work order ID from input (default matches challenge-3 maintenance_scheduler_agent.py)
-                    work_order_id = extract_work_order_id(input_text) if input_text else None
-                    if not work_order_id:
-                        work_order_id = "wo-2024-468"  # fallback default
-                    logger.info(f"Looking up work order: '{work_order_id}'")
-
-                    # Get work order and run prediction
-                    work_order = await cosmos_service.get_work_order(work_order_id)
-                    logger.info(f"Found work order: {work_order.id} for machine: {work_order.machine_id}")
-                    history = await cosmos_service.get_maintenance_history(work_order.machine_id)
-                    windows = await cosmos_service.get_available_maintenance_windows(14)
-
-                    schedule = await agent.predict_schedule(work_order, history, windows)
-
-                    response_text = (
-                        f"Maintenance Schedule Created:\n"
-                        f"- Schedule ID: {schedule.id}\n"
-                        f"- Machine: {schedule.machine_id}\n"
-                        f"- Scheduled Date: {schedule.scheduled_date}\n"
-                        f"- Risk Score: {schedule.risk_score}/100\n"
-                        f"- Failure Probability: {schedule.predicted_failure_probability * 100:.1f}%\n"
-                        f"- Recommended Action: {schedule.recommended_action}\n"
-                        f"- Reasoning: {schedule.reasoning}"
-                    )
-
-                    await cosmos_service.save_maintenance_schedule(schedule)
+                    async with (
+                        DefaultAzureCredential() as credential,
+                        CosmosDbService(cosmos_endpoint, cosmos_key, database_name) as cosmos_service,
+                    ):
+                        await cosmos_service.ensure_containers("MaintenanceSchedules", "ChatHistories")
+                        agent = MaintenanceSchedulerAgent(project_endpoint, deployment_name, cosmos_service, credential)
+
+                        # Parse work order ID from input (default matches challenge-3 maintenance_scheduler_agent.py)
+                        work_order_id = extract_work_order_id(input_text) if input_text else None
+                        if not work_order_id:
+                            work_order_id = "wo-2024-468"  # fallback default
+                        logger.info(f"Looking up work order: '{work_order_id}'")
+
+                        # Get work order and run prediction
+                        work_order = await cosmos_service.get_work_order(work_order_id)
+                        logger.info(f"Found work order: {work_order.id} for machine: {work_order.machine_id}")
+                        history = await cosmos_service.get_maintenance_history(work_order.machine_id)
+                        windows = await cosmos_service.get_available_maintenance_windows(14)
+
+                        schedule = await agent.predict_schedule(work_order, history, windows)
+
+                        response_text = (
+                            f"Maintenance Schedule Created:\n"
+                            f"- Schedule ID: {schedule.id}\n"
+                            f"- Machine: {schedule.machine_id}\n"
+                            f"- Scheduled Date: {schedule.scheduled_date}\n"
+                            f"- Risk Score: {schedule.risk_score}/100\n"
+                            f"- Failure Probability: {schedule.predicted_failure_probability * 100:.1f}%\n"
+                            f"- Recommended Action: {schedule.recommended_action}\n"
+                            f"- Reasoning: {schedule.reasoning}"
+                        )
+
+                        await cosmos_service.save_maintenance_schedule(schedule)
 
             except Exception as e:
                 logger.exception("MaintenanceSchedulerAgent error")
@@ -219,45 +224,50 @@ def create_parts_ordering_a2a_app():
                 if not all([cosmos_endpoint, cosmos_key, database_name, project_endpoint]):
                     response_text = "Error: Missing required environment variables for PartsOrderingAgent"
                 else:
-                    cosmos_service = CosmosDbService(cosmos_endpoint, cosmos_key, database_name)
-                    agent = PartsOrderingAgent(project_endpoint, deployment_name, cosmos_service)
-
-                    # Parse work order ID from input (default matches challenge-3 parts_ordering_agent.py)
-                    work_order_id = extract_work_order_id(input_text) if input_text else None
-                    if not work_order_id:
-                        work_order_id = "wo-2024-468"  # fallback default
-
-                    # Get work order and generate order
-                    work_order = await cosmos_service.get_work_order(work_order_id)
-                    part_numbers = [p.part_number for p in work_order.required_parts]
-                    inventory = await cosmos_service.get_inventory_items(part_numbers)
-
-                    parts_needing_order = [p for p in work_order.required_parts if not p.is_available]
-
-                    if not parts_needing_order:
-                        response_text = "All required parts are available in stock. No parts order needed."
-                        await cosmos_service.update_work_order_status(work_order.id, "Ready")
-                    else:
-                        needed_part_numbers = [p.part_number for p in parts_needing_order]
-                        suppliers = await cosmos_service.get_suppliers_for_parts(needed_part_numbers)
-
-                        if not suppliers:
-                            response_text = "Error: No suppliers found for required parts."
-                        else:
-                            order = await agent.generate_order(work_order, inventory, suppliers)
-
-                            response_text = (
-                                f"Parts Order Generated:\n"
-                                f"- Order ID: {order.id}\n"
-                                f"- Work Order: {order.work_order_id}\n"
-                                f"- Supplier: {order.supplier_name}\n"
-                                f"- Expected Delivery: {order.expected_delivery_date}\n"
-                                f"- Total Cost: ${order.total_cost:.2f}\n"
-                                f"- Items: {len(order.order_items)} part(s)"
-                            )
-
-                            await cosmos_service.save_parts_order(order)
-                            await cosmos_service.update_work_order_status(work_order.id, "PartsOrdered")
+                    async with CosmosDbService(cosmos_endpoint, cosmos_key, database_name) as cosmos_service:
+                        await cosmos_service.ensure_containers("PartsOrders", "ChatHistories")
+                        agent = PartsOrderingAgent(project_endpoint, deployment_name, cosmos_service)
+                        try:
+                            # Parse work order ID from input (default matches challenge-3 parts_ordering_agent.py)
+                            work_order_id = extract_work_order_id(input_text) if input_text else None
+                            if not work_order_id:
+                                work_order_id = "wo-2024-468"  # fallback default
+
+                            # Get work order and generate order
+                            work_order = await cosmos_service.get_work_order(work_order_id)
+
+                            parts_needing_order = [p for p in work_order.required_parts if not p.is_available]
+
+                            if not parts_needing_order:
+                                response_text = "All required parts are available in stock. No parts order needed."
+                                await cosmos_service.update_work_order_status(work_order.id, "Ready")
+                            else:
+                                needed_part_numbers = [p.part_number for p in parts_needing_order]
+                                inventory, suppliers, chat_history = await asyncio.gather(
+                                    cosmos_service.get_inventory_items(work_order.part_numbers),
+                                    cosmos_service.get_suppliers_for_parts(needed_part_numbers),
+                                    cosmos_service.get_work_order_chat_history(work_order.id),
+                                )
+
+                                if not suppliers:
+                                    response_text = "Error: No suppliers found for required parts."
+                                else:
+                                    order = await agent.generate_order(work_order, inventory, suppliers, chat_history)
+
+                                    response_text = (
+                                        f"Parts Order Generated:\n"
+                                        f"- Order ID: {order.id}\n"
+                                        f"- Work Order: {order.work_order_id}\n"
+                                        f"- Supplier: {order.supplier_name}\n"
+                                        f"- Expected Delivery: {order.expected_delivery_date}\n"
+                                        f"- Total Cost: ${order.total_cost:.2f}\n"
+                                        f"- Items: {len(order.order_items)} part(s)"
+                                    )
+
+                                    await cosmos_service.save_parts_order(order)
+                                    await cosmos_service.update_work_order_status(work_order.id, "PartsOrdered")
+                        finally:
+                            await agent.aclose()
 
             except Exception as e:
                 logger.exception("PartsOrderingAgent error")